@@ -1,4 +1,5 @@
 import sys
+import multiprocessing
 from PyQt5.QtWidgets import (QMainWindow, QTabWidget, QStatusBar, QMenuBar, 
                               QMenu, QMessageBox, QLabel, QAction, QApplication)
 from PyQt5.QtCore import Qt
@@ -10,6 +11,8 @@ from tabs.tab_params import TabParams
 from tabs.tab_results import TabResults
 from tabs.tab_plots import TabPlots
 from tabs.tab_about import TabAbout
+from modules.result_cache import ResultCache
+from utils.config import DEFAULT_SETTINGS
 
 
 class MainWindow(QMainWindow):
@@ -26,11 +29,15 @@ class MainWindow(QMainWindow):
         self.analysis_result = None
         self.analysis_method = 'param'
         self.posthoc_summary = None
+        self.posthoc_correction = DEFAULT_SETTINGS['posthoc_correction']
+        self.posthoc_lazy = DEFAULT_SETTINGS['posthoc_lazy']
         self.selected_indicator = None
 
         self.cached_spm_result = None
         self.cached_inference_result = None
         self.cached_posthoc_results = None
+        self.result_cache = ResultCache(DEFAULT_SETTINGS['result_cache_size'],
+                                        DEFAULT_SETTINGS['result_cache_max_mb'] * 1024 * 1024)
 
         self.setup_ui()
         self.setup_menu()
@@ -88,6 +95,31 @@ class MainWindow(QMainWindow):
         if self.current_tab_index > 0:
             self.tab_widget.setCurrentIndex(self.current_tab_index - 1)
 
+    def invalidate_indicator_results(self, indicators):
+        """指标数据变化后作废其正态性检验、分析与事后检验结果，其他指标不受影响"""
+        if self.selected_indicator not in indicators:
+            return False
+
+        self.normality_results = None
+        self.analysis_result = None
+        self.posthoc_summary = None
+        self.cached_spm_result = None
+        self.cached_inference_result = None
+        self.cached_posthoc_results = None
+
+        self.tab_normality.discard_test()
+        self.tab_normality.results = None
+        self.tab_normality.result_table.setRowCount(0)
+        self.tab_normality.recommendation_text.clear()
+        self.tab_results.cancel_posthoc()
+        self.tab_results.summary = None
+        self.tab_results.posthoc_summary = None
+        self.tab_results.summary_table.setRowCount(0)
+        self.tab_results.posthoc_text.clear()
+
+        self.statusBar().showMessage(f"指标 {self.selected_indicator} 的数据已更新，请重新进行正态性检验与分析")
+        return True
+
     def show_about(self):
         QMessageBox.about(self, "关于 SPM1D 分析软件",
                          """SPM1D 分析软件 v1.1
@@ -109,12 +141,15 @@ class MainWindow(QMainWindow):
                                     QMessageBox.StandardButton.Yes |
                                     QMessageBox.StandardButton.No)
         if reply == QMessageBox.StandardButton.Yes:
+            self.tab_normality.discard_test(wait=True)
+            self.tab_results.cancel_posthoc(wait=True)
             event.accept()
         else:
             event.ignore()
 
 
 def main():
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
     window = MainWindow()
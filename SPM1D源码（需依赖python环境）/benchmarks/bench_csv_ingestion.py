@@ -0,0 +1,64 @@
+"""CSV 读取性能对比：pandas 类型推断路径 vs 显式数值模式快速路径
+
+用法（在源码目录下运行）:
+    python benchmarks/bench_csv_ingestion.py [--rows 200] [--cols 5000] [--repeat 3]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.data_loader import CSV_ENGINE, load_csv_fast, load_group_file_pandas, pyarrow
+
+
+def write_wide_csv(path, n_rows, n_cols, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.standard_normal((n_rows, n_cols)),
+                      columns=[f"T{i + 1}" for i in range(n_cols)])
+    df.insert(0, 'Subject', [f"Subject{i + 1}" for i in range(n_rows)])
+    df.to_csv(path, index=False)
+
+
+def best_time(func, path, repeat):
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(path)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--cols', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'wide.csv')
+        write_wide_csv(path, args.rows, args.cols)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+
+        t_pandas, ref = best_time(load_group_file_pandas, path, args.repeat)
+        engines = ['c'] + (['pyarrow'] if pyarrow is not None else [])
+        fast_results = {engine: best_time(lambda p, e=engine: load_csv_fast(p, engine=e), path, args.repeat)
+                        for engine in engines}
+
+    print(f"文件: {args.rows} 行 x {args.cols} 列 ({size_mb:.1f} MB), CPU 核数: {os.cpu_count()}, "
+          f"默认快速引擎: {CSV_ENGINE}")
+    print(f"pandas 推断路径        : {t_pandas * 1000:8.1f} ms  结果类型 {ref.dtype}")
+    for engine, (t_fast, fast) in fast_results.items():
+        max_diff = float(np.max(np.abs(fast - ref)))
+        print(f"显式模式快速路径 ({engine:7s}): {t_fast * 1000:8.1f} ms  (加速 {t_pandas / t_fast:.2f}x, "
+              f"最大差异 {max_diff:.1e}, C 连续: {fast.flags['C_CONTIGUOUS']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""float32 存储模式对比：内存占用与 SPM 统计场的精度
+
+以 float64 和 float32 两种精度保存同一批组别数据，分别运行参数/非参数检验，
+比较统计场 z 与临界阈值。超出容差时以非零状态退出。
+
+用法（在源码目录下运行）:
+    python benchmarks/bench_float32_storage.py [--groups 3] [--subjects 20] [--nodes 101] [--rtol 1e-4]
+"""
+import os
+import sys
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.data_loader import prepare_groups
+from modules.spm_analysis import SPMAnalyzer
+
+
+def make_groups(n_groups, n_subjects, n_nodes, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, n_nodes)
+    groups = {}
+    for i in range(n_groups):
+        signal = 10 * np.sin(2 * np.pi * t) + 0.5 * i * np.exp(-((t - 0.6) / 0.1) ** 2)
+        noise = rng.standard_normal((n_subjects, n_nodes)).cumsum(axis=1) * 0.3
+        groups[f"G{i + 1}"] = 100 + signal + noise
+    return groups
+
+
+def run(groups, test_type, method):
+    analyzer = SPMAnalyzer(groups, test_type=test_type, method=method)
+    np.random.seed(0)
+    spm_result, error = analyzer.run_analysis()
+    if error:
+        raise RuntimeError(error)
+    inference, error = analyzer.inference(alpha=0.05, iterations=200)
+    if error:
+        raise RuntimeError(error)
+    return spm_result.z, inference.zstar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', type=int, default=3)
+    parser.add_argument('--subjects', type=int, default=20)
+    parser.add_argument('--nodes', type=int, default=101)
+    parser.add_argument('--rtol', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    data64 = make_groups(args.groups, args.subjects, args.nodes)
+    data32 = prepare_groups(data64, dtype=np.float32)
+    bytes64 = sum(data.nbytes for data in data64.values())
+    bytes32 = sum(data.nbytes for data in data32.values())
+    print(f"数据: {args.groups} 组 x {args.subjects} 个样本 x {args.nodes} 个时间点")
+    print(f"常驻内存: float64 {bytes64 / 1024:.1f} KB, float32 {bytes32 / 1024:.1f} KB")
+
+    cases = [('anova1', 'param'), ('ttest2', 'param'), ('anova1', 'nonparam'), ('ttest2', 'nonparam')]
+    failed = False
+    for test_type, method in cases:
+        subset64 = data64 if test_type == 'anova1' else dict(list(data64.items())[:2])
+        subset32 = data32 if test_type == 'anova1' else dict(list(data32.items())[:2])
+        z64, zstar64 = run(subset64, test_type, method)
+        z32, zstar32 = run(subset32, test_type, method)
+        z_err = float(np.max(np.abs(z32 - z64) / np.maximum(np.abs(z64), 1.0)))
+        zstar_err = abs(zstar32 - zstar64) / max(abs(zstar64), 1.0)
+        ok = np.allclose(z32, z64, rtol=args.rtol, atol=args.rtol) and zstar_err <= args.rtol
+        failed = failed or not ok
+        print(f"{test_type:7s} {method:8s}: z 最大相对差 {z_err:.2e}, 阈值相对差 {zstar_err:.2e}  "
+              f"{'通过' if ok else '超出容差'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
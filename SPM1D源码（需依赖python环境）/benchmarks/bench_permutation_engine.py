@@ -0,0 +1,109 @@
+"""非参数置换检验：spm1d 逐次置换与分块矩阵运算的耗时和结果对比
+
+同一随机种子下分别用 spm1d 原有实现和 modules.permutation 的分块实现完成推断，
+比较临界阈值与聚类 p 值；对小样本比较两者的精确枚举（iterations=-1）；再以种子
+派生随机数流的多进程模式运行，检查不同进程数的置换分布逐位相同。超出容差或结果
+不一致时以非零状态退出。
+
+用法（在源码目录下运行）:
+    python benchmarks/bench_permutation_engine.py [--subjects 15] [--nodes 101] [--iterations 10000] [--rtol 1e-8] [--workers 4]
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import spm1d
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.permutation import install_batched_permuter
+
+
+def make_groups(n_subjects, n_nodes, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.linspace(0, 1, n_nodes)
+    groups = []
+    for i in range(3):
+        noise = rng.standard_normal((n_subjects + i, n_nodes)).cumsum(axis=1) * 0.5
+        groups.append(100 + 3 * i * np.sin(3 * t) + noise)
+    return groups
+
+
+def run(build, iterations, batched):
+    snpm = build()
+    if batched:
+        install_batched_permuter(snpm)
+    np.random.seed(42)
+    t0 = time.perf_counter()
+    inference = snpm.inference(alpha=0.05, iterations=iterations)
+    return time.perf_counter() - t0, inference
+
+
+def run_seeded(build, iterations, workers):
+    snpm = build()
+    install_batched_permuter(snpm, seed=42, workers=workers)
+    t0 = time.perf_counter()
+    snpm.inference(alpha=0.05, iterations=iterations)
+    return time.perf_counter() - t0, snpm.mgr.ZZ
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subjects', type=int, default=15)
+    parser.add_argument('--nodes', type=int, default=101)
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--rtol', type=float, default=1e-8)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    YA, YB, YC = make_groups(args.subjects, args.nodes)
+    n = YA.shape[0]
+    cases = [
+        ('ttest', lambda: spm1d.stats.nonparam.ttest(YA - 100, 0)),
+        ('ttest_paired', lambda: spm1d.stats.nonparam.ttest_paired(YA, YB[:n])),
+        ('ttest2', lambda: spm1d.stats.nonparam.ttest2(YA, YB)),
+        ('anova1', lambda: spm1d.stats.nonparam.anova1(
+            np.vstack([YA, YB, YC]), np.repeat([0, 1, 2], [len(YA), len(YB), len(YC)]))),
+    ]
+
+    print(f"数据: {n} 个样本 x {args.nodes} 个时间点, {args.iterations} 次置换")
+    failed = False
+    for name, build in cases:
+        t_ref, ref = run(build, args.iterations, batched=False)
+        t_new, new = run(build, args.iterations, batched=True)
+        zstar_err = abs(new.zstar - ref.zstar) / max(abs(ref.zstar), 1.0)
+        p_ok = len(ref.p) == len(new.p) and np.allclose(ref.p, new.p, rtol=args.rtol)
+        ok = zstar_err <= args.rtol and p_ok
+        failed = failed or not ok
+        print(f"{name:12s}: spm1d {t_ref:6.2f} s, 分块 {t_new:6.2f} s ({t_ref / t_new:5.1f}x), "
+              f"阈值相对差 {zstar_err:.1e}, 聚类p {'一致' if p_ok else '不一致'}")
+
+    print("精确枚举: 配对 11 例 (2048 种) 与两样本 6 vs 7 例 (1716 种)")
+    exact_cases = [
+        ('ttest_paired', lambda: spm1d.stats.nonparam.ttest_paired(YA[:11], YB[:11])),
+        ('ttest2', lambda: spm1d.stats.nonparam.ttest2(YA[:6], YB[:7])),
+    ]
+    for name, build in exact_cases:
+        t_ref, ref = run(build, -1, batched=False)
+        t_new, new = run(build, -1, batched=True)
+        zstar_err = abs(new.zstar - ref.zstar) / max(abs(ref.zstar), 1.0)
+        p_ok = len(ref.p) == len(new.p) and np.allclose(ref.p, new.p, rtol=args.rtol)
+        ok = zstar_err <= args.rtol and p_ok
+        failed = failed or not ok
+        print(f"{name:12s}: spm1d {t_ref:6.2f} s, 分块 {t_new:6.2f} s ({t_ref / t_new:5.1f}x), "
+              f"阈值相对差 {zstar_err:.1e}, 聚类p {'一致' if p_ok else '不一致'}")
+
+    print(f"种子流模式: 1 个进程与 {args.workers} 个进程")
+    for name, build in cases:
+        t_one, ZZ_one = run_seeded(build, args.iterations, 1)
+        t_many, ZZ_many = run_seeded(build, args.iterations, args.workers)
+        same = np.array_equal(ZZ_one, ZZ_many)
+        failed = failed or not same
+        print(f"{name:12s}: {t_one:6.2f} s / {t_many:6.2f} s, 置换分布{'逐位相同' if same else '不一致'}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
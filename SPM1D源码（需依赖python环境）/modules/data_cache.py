@@ -0,0 +1,140 @@
+import os
+import hashlib
+import numpy as np
+from utils.constants import DATA_DIR
+from utils.config import DEFAULT_SETTINGS
+
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+# 写入超限时淘汰到上限的这一比例，留出余量，避免之后每次写入都重新扫描目录
+EVICT_LOW_WATER = 0.9
+
+_default_cache = None
+
+class DataCache:
+    """已解析数据的磁盘缓存
+
+    每个组别矩阵保存为一个 .npy 文件，以 文件绝对路径 + 大小 + 修改时间 作为键，
+    源文件变化后自动失效。读取时以内存映射方式打开，按最近访问时间做容量淘汰。
+    缓存总大小在首次写入时扫描一次目录得到，之后随写入累加，只有超过上限时才
+    重新扫描并淘汰。
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._total_bytes = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, filepath, variant=''):
+        stat = os.stat(filepath)
+        raw = f"{os.path.abspath(filepath)}|{stat.st_size}|{stat.st_mtime_ns}|{variant}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, filepath, variant=''):
+        """命中时返回只读内存映射数组，否则返回 None"""
+        try:
+            path = self._entry_path(self.make_key(filepath, variant))
+        except OSError:
+            return None
+        if not os.path.exists(path):
+            return None
+        try:
+            data = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            if self._remove(path):
+                # 损坏条目的大小未知，下次写入时重新扫描
+                self._total_bytes = None
+            return None
+        try:
+            # 以修改时间记录最近访问，供 LRU 淘汰使用
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, filepath, data, variant=''):
+        try:
+            path = self._entry_path(self.make_key(filepath, variant))
+        except OSError:
+            return
+        if self._total_bytes is None:
+            self.evict()
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            with open(tmp_path, 'wb') as f:
+                np.save(f, np.ascontiguousarray(data), allow_pickle=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except (OSError, ValueError):
+            self._remove(tmp_path)
+            return
+        self._total_bytes += size - replaced
+        if self._total_bytes > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICT_LOW_WATER))
+
+    def get_groups(self, filepath, variant=''):
+        """读取一个文件解析出的全部组别，返回 {组别: ndarray}；任一条目缺失时返回 None"""
+        names = self.get(filepath, variant=f'{variant}groups')
+        if names is None:
+            return None
+        groups = {}
+        for i, name in enumerate(names.tolist()):
+            data = self.get(filepath, variant=f'{variant}group{i}')
+            if data is None:
+                return None
+            groups[name] = data
+        return groups
+
+    def put_groups(self, filepath, groups, variant=''):
+        """按组别分别保存，另存一份组别名清单，用于多工作表/多数组文件"""
+        for i, data in enumerate(groups.values()):
+            self.put(filepath, data, variant=f'{variant}group{i}')
+        self.put(filepath, np.array(list(groups), dtype=str), variant=f'{variant}groups')
+
+    def evict(self, target_bytes=None):
+        """删除最久未访问的条目，直到缓存总大小不超过 target_bytes（默认为上限）"""
+        if target_bytes is None:
+            target_bytes = self.max_bytes
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= target_bytes:
+                break
+            if self._remove(path):
+                total -= size
+        self._total_bytes = total
+
+    def clear(self):
+        for name in os.listdir(self.cache_dir):
+            self._remove(os.path.join(self.cache_dir, name))
+        self._total_bytes = 0
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+def get_default_cache():
+    """按 DEFAULT_SETTINGS 创建（或复用）全局缓存，禁用时返回 None"""
+    global _default_cache
+    if not DEFAULT_SETTINGS.get('cache_enabled', True):
+        return None
+    if _default_cache is None:
+        _default_cache = DataCache(max_bytes=int(DEFAULT_SETTINGS.get('cache_max_mb', 1024)) * 1024 * 1024)
+    return _default_cache
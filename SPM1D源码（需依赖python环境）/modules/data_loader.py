@@ -1,6 +1,26 @@
 import os
+import csv
+import time
+import zipfile
+import itertools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import pandas as pd
 import numpy as np
+from utils.helpers import validate_data_format
+
+try:
+    import pyarrow
+    import pyarrow.csv as pyarrow_csv
+except ImportError:
+    pyarrow = None
+
+# pyarrow 的优势来自多线程解析，单核环境下 pandas C 引擎更快
+CSV_ENGINE = 'pyarrow' if pyarrow is not None and (os.cpu_count() or 1) > 1 else 'c'
+
+SUPPORTED_EXTENSIONS = ('.csv', '.xlsx', '.xls', '.npy', '.npz')
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+NUMPY_EXTENSIONS = ('.npy', '.npz')
 
 def load_single_file(filepath):
     ext = os.path.splitext(filepath)[1].lower()
@@ -11,52 +31,515 @@ def load_single_file(filepath):
     else:
         raise ValueError(f"不支持的文件格式: {ext}")
 
-def load_group_file(filepath):
+def _as_group_matrix(data, source):
+    valid, msg = validate_data_format(data)
+    if not valid:
+        raise ValueError(f"{source}: {msg}")
+    if data.dtype.kind not in 'fiu':
+        raise ValueError(f"{source}: 数据类型 {data.dtype} 不是数值类型")
+    if data.dtype.kind != 'f':
+        data = data.astype(np.float64)
+    return data
+
+def load_npy_file(filepath):
+    """以只读内存映射方式打开 .npy 组别矩阵，浮点数据不复制"""
+    return _as_group_matrix(np.load(filepath, mmap_mode='r'), filepath)
+
+def load_npz_file(filepath):
+    """读取 .npz 中的全部数组，返回 {数组名: 组别矩阵}（npz 为压缩包，无法内存映射）"""
+    with np.load(filepath) as archive:
+        return {name: _as_group_matrix(archive[name], f"{filepath}[{name}]")
+                for name in archive.files}
+
+def _read_csv_head(filepath):
+    with open(filepath, 'r', newline='', encoding='utf-8-sig', errors='replace') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        first_row = next(reader, None)
+    if header is None or first_row is None:
+        raise ValueError(f"文件 {filepath} 中没有数据行")
+    return header, first_row
+
+def _is_numeric_cell(value):
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return True
+    try:
+        float(str(value).strip())
+        return True
+    except ValueError:
+        return False
+
+def _csv_numeric_columns(header, first_row):
+    """由首行数据确定数值列：有表头且为数值或空白的列（空白读作 NaN）"""
+    return [i for i, value in enumerate(first_row)
+            if i < len(header) and (value.strip() == '' or _is_numeric_cell(value))]
+
+def load_csv_fast(filepath, dtype=np.float64, engine=None):
+    """按显式数值模式直接把 CSV 解析为连续浮点矩阵
+
+    由首行数据确定数值列，只读取这些列并直接指定 dtype，跳过逐列类型推断和
+    select_dtypes 的二次复制。后续行出现非数值内容时抛出 ValueError。
+    """
+    header, first_row = _read_csv_head(filepath)
+    numeric_cols = _csv_numeric_columns(header, first_row)
+    if not numeric_cols:
+        raise ValueError(f"文件 {filepath} 中没有数值列")
+    if (engine or CSV_ENGINE) == 'pyarrow':
+        return _read_csv_columns_pyarrow(filepath, numeric_cols, dtype)
+    df = pd.read_csv(filepath, usecols=numeric_cols, dtype=dtype, engine='c')
+    if df.shape[1] != len(numeric_cols):
+        raise ValueError(f"文件 {filepath} 列数与表头不一致")
+    return np.ascontiguousarray(df.to_numpy(dtype=dtype, copy=False))
+
+def _read_csv_columns_pyarrow(filepath, numeric_cols, dtype):
+    # 以列序号命名，避免重复表头；多线程解析后按列填入预分配的连续矩阵
+    names = [f"c{i}" for i in numeric_cols]
+    arrow_type = pyarrow.from_numpy_dtype(np.dtype(dtype))
+    table = pyarrow_csv.read_csv(
+        filepath,
+        read_options=pyarrow_csv.ReadOptions(skip_rows=1, autogenerate_column_names=True),
+        convert_options=pyarrow_csv.ConvertOptions(include_columns=[f"f{i}" for i in numeric_cols],
+                                                   column_types={f"f{i}": arrow_type for i in numeric_cols}),
+    )
+    table = table.rename_columns(names)
+    data = np.empty((table.num_rows, len(names)), dtype=dtype)
+    for j, name in enumerate(names):
+        data[:, j] = table.column(name).to_numpy()
+    return data
+
+def load_group_file_pandas(filepath):
     df = load_single_file(filepath)
     numeric_df = df.select_dtypes(include=[np.number])
     if numeric_df.shape[1] == 0:
         raise ValueError(f"文件 {filepath} 中没有数值列")
     return numeric_df.values
 
-def load_indicator_folder(folder_path):
+def _is_excel_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _sheet_numeric_columns(header, first_row):
+    """工作表中由首行数据确定的数值列，空单元格读作 NaN；没有数值数据时返回空列表"""
+    numeric_cols = [j for j, value in enumerate(first_row)
+                    if j < len(header) and (header[j] is not None or value is not None)
+                    and (value is None or _is_excel_number(value))]
+    if all(first_row[j] is None for j in numeric_cols):
+        return []
+    return numeric_cols
+
+def _stream_sheet_matrix(sheet, source, dtype=np.float64):
+    """逐行读取工作表的数值列，填入预分配矩阵；工作表没有数值数据时返回 None"""
+    rows = sheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    first_row = next(rows, None)
+    if header is None or first_row is None:
+        return None
+    numeric_cols = _sheet_numeric_columns(header, first_row)
+    if not numeric_cols:
+        return None
+
+    capacity = max((sheet.max_row or 0) - 1, 1)
+    data = np.empty((capacity, len(numeric_cols)), dtype=dtype)
+    n_rows = 0
+    n_kept = 0
+    for row in itertools.chain([first_row], rows):
+        values = [row[j] if j < len(row) else None for j in numeric_cols]
+        if n_rows == data.shape[0]:
+            data = np.concatenate([data, np.empty_like(data)])
+        for value in values:
+            if value is not None and not _is_excel_number(value):
+                raise ValueError(f"{source}: 数值列中包含非数值内容 {value!r}")
+        # None 写入浮点数组即为 NaN
+        data[n_rows] = values
+        n_rows += 1
+        if any(value is not None for value in row):
+            n_kept = n_rows
+    return data[:n_kept]
+
+def _workbook_sheets_pandas(filepath, sheet_name=None):
+    sheets = pd.read_excel(filepath, sheet_name=sheet_name)
+    if not isinstance(sheets, dict):
+        sheets = {sheet_name: sheets}
     groups = {}
-    files = [f for f in os.listdir(folder_path)
-             if f.endswith(('.csv', '.xlsx', '.xls'))]
+    for name, df in sheets.items():
+        numeric_df = df.select_dtypes(include=[np.number])
+        if numeric_df.shape[1] > 0 and numeric_df.shape[0] > 0:
+            groups[str(name)] = numeric_df.values
+    return groups
+
+def load_workbook_groups(filepath, dtype=np.float64):
+    """只打开一次工作簿，逐个工作表流式解析，返回 {工作表名: ndarray}
+
+    .xlsx 使用 openpyxl 只读模式逐行读取，每个工作表只保留一个数值矩阵；没有数值
+    数据的工作表（如说明页）被跳过。数值列中混有文本的工作表退回 pandas 解析。
+    .xls 由 pandas 一次读取全部工作表。
+    """
+    if not filepath.lower().endswith('.xlsx'):
+        groups = _workbook_sheets_pandas(filepath)
+    else:
+        from openpyxl import load_workbook
+        groups = {}
+        workbook = load_workbook(filepath, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                source = f"{filepath}[{sheet.title}]"
+                try:
+                    data = _stream_sheet_matrix(sheet, source, dtype)
+                except (ValueError, TypeError):
+                    data = None
+                    groups.update(_workbook_sheets_pandas(filepath, sheet.title))
+                if data is not None and data.shape[0] > 0:
+                    groups[sheet.title] = data
+        finally:
+            workbook.close()
+    if not groups:
+        raise ValueError(f"文件 {filepath} 中没有数值列")
+    return groups
 
-    for filename in files:
-        filepath = os.path.join(folder_path, filename)
+def load_group_file(filepath):
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.npy':
+        return load_npy_file(filepath)
+    if ext == '.csv':
         try:
-            group_name = os.path.splitext(filename)[0]
-            data = load_group_file(filepath)
-            groups[group_name] = data
-        except Exception as e:
-            print(f"加载文件 {filename} 失败: {str(e)}")
+            return load_csv_fast(filepath)
+        except (ValueError, TypeError, pd.errors.ParserError):
+            # 格式不规整的文件退回 pandas 类型推断路径
+            pass
+    return load_group_file_pandas(filepath)
+
+def load_file_groups(filepath, group_name=None):
+    """解析一个数据文件，返回 {组别: ndarray}
 
+    普通文件只包含一个组别，以 group_name（默认为文件名）命名；包含多个工作表的
+    工作簿按工作表名、包含多个数组的 .npz 文件按数组名拆分为多个组别。
+    """
+    if group_name is None:
+        group_name = os.path.splitext(os.path.basename(filepath))[0]
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.npz':
+        groups = load_npz_file(filepath)
+        if not groups:
+            raise ValueError(f"文件 {filepath} 中没有数组")
+    elif ext in EXCEL_EXTENSIONS:
+        groups = load_workbook_groups(filepath)
+    else:
+        return {group_name: load_group_file(filepath)}
+    if len(groups) == 1:
+        return {group_name: next(iter(groups.values()))}
     return groups
 
-def load_data_by_indicator(root_path):
-    indicators = {}
+def _scan_csv_header(filepath):
+    header, first_row = _read_csv_head(filepath)
+
+    n_lines = 0
+    last_chunk = b''
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            n_lines += chunk.count(b'\n')
+            last_chunk = chunk
+    if last_chunk and not last_chunk.endswith(b'\n'):
+        n_lines += 1
+
+    return {'n_rows': n_lines - 1, 'n_cols': len(_csv_numeric_columns(header, first_row))}
+
+def _scan_xlsx_header(filepath):
+    """读取每个工作表的表头与首行数据，返回 {工作表名: {'n_rows', 'n_cols'}}"""
+    from openpyxl import load_workbook
+    infos = {}
+    workbook = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(min_row=1, max_row=2, values_only=True)
+            header = next(rows, None)
+            first_row = next(rows, None)
+            if header is None or first_row is None:
+                continue
+            n_cols = len(_sheet_numeric_columns(header, first_row))
+            if n_cols == 0:
+                continue
+            n_rows = sheet.max_row
+            if n_rows is None:
+                n_rows = sum(1 for _ in sheet.iter_rows(values_only=True))
+            infos[sheet.title] = {'n_rows': n_rows - 1, 'n_cols': n_cols}
+    finally:
+        workbook.close()
+    if not infos:
+        raise ValueError(f"文件 {filepath} 中没有数据行")
+    return infos
+
+def _read_npy_shape(fp, source):
+    version = np.lib.format.read_magic(fp)
+    if version == (1, 0):
+        shape, _, dtype = np.lib.format.read_array_header_1_0(fp)
+    else:
+        shape, _, dtype = np.lib.format.read_array_header_2_0(fp)
+    if len(shape) != 2:
+        raise ValueError(f"{source}: 数据必须是2维数组，当前为{len(shape)}维")
+    if dtype.kind not in 'fiu':
+        raise ValueError(f"{source}: 数据类型 {dtype} 不是数值类型")
+    return {'n_rows': shape[0], 'n_cols': shape[1]}
+
+def _scan_npz_header(filepath):
+    with zipfile.ZipFile(filepath) as archive:
+        names = [n for n in archive.namelist() if n.endswith('.npy')]
+        infos = {}
+        for name in names:
+            with archive.open(name) as fp:
+                infos[name[:-len('.npy')]] = _read_npy_shape(fp, f"{filepath}[{name}]")
+    if not infos:
+        raise ValueError(f"文件 {filepath} 中没有数组")
+    return infos
+
+def scan_file_groups(filepath, group_name=None):
+    """不解析数据，只读取文件头，返回 {组别: {'n_rows', 'n_cols'}}"""
+    if group_name is None:
+        group_name = os.path.splitext(os.path.basename(filepath))[0]
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.npz':
+        infos = _scan_npz_header(filepath)
+    elif ext == '.xlsx':
+        infos = _scan_xlsx_header(filepath)
+    elif ext == '.xls':
+        infos = {name: {'n_rows': data.shape[0], 'n_cols': data.shape[1]}
+                 for name, data in load_workbook_groups(filepath).items()}
+    else:
+        return {group_name: scan_file_header(filepath)}
+    if len(infos) == 1:
+        return {group_name: next(iter(infos.values()))}
+    return infos
+
+def scan_file_header(filepath):
+    """只读取表头与第一行数据，估计组别矩阵形状，返回 {'n_rows', 'n_cols'}"""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext == '.csv':
+        info = _scan_csv_header(filepath)
+    elif ext == '.npy':
+        with open(filepath, 'rb') as fp:
+            info = _read_npy_shape(fp, filepath)
+    else:
+        data = load_group_file(filepath)
+        info = {'n_rows': data.shape[0], 'n_cols': data.shape[1]}
+    if info['n_cols'] == 0:
+        raise ValueError(f"文件 {filepath} 中没有数值列")
+    return info
+
+def list_group_files(folder_path):
+    """列出指标文件夹中的数据文件，返回 [(组别, 文件路径), ...]"""
+    files = [f for f in os.listdir(folder_path)
+             if f.endswith(SUPPORTED_EXTENSIONS)]
+    return [(os.path.splitext(f)[0], os.path.join(folder_path, f)) for f in files]
+
+def list_indicator_folders(root_path):
+    """识别根目录结构，返回 [(指标, 指标文件夹路径), ...]"""
     items = os.listdir(root_path)
-    
+
     folders = [item for item in items
                if os.path.isdir(os.path.join(root_path, item))]
-    
+
     files = [f for f in items
-             if f.endswith(('.csv', '.xlsx', '.xls'))]
-    
+             if f.endswith(SUPPORTED_EXTENSIONS)]
+
     if files and not folders:
         root_name = os.path.basename(root_path) if root_path else "数据"
-        groups = load_indicator_folder(root_path)
-        if groups:
-            indicators[root_name] = groups
-    elif folders:
-        for folder in folders:
-            folder_path = os.path.join(root_path, folder)
-            groups = load_indicator_folder(folder_path)
-            if groups:
-                indicators[folder] = groups
-    
-    return indicators
+        return [(root_name, root_path)]
+    return [(folder, os.path.join(root_path, folder)) for folder in folders]
+
+def scan_indicator_tree(root_path):
+    """扫描根目录结构，返回 {指标: [(组别, 文件路径), ...]}"""
+    return {indicator_name: list_group_files(folder_path)
+            for indicator_name, folder_path in list_indicator_folders(root_path)}
+
+def snapshot_tree(tree):
+    """记录目录树中每个文件的 (大小, 修改时间)，返回 {文件路径: (st_size, st_mtime_ns)}"""
+    snapshot = {}
+    for group_files in tree.values():
+        for _, filepath in group_files:
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            snapshot[filepath] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+def diff_snapshots(old, new):
+    """比较两次快照，返回 (新增文件, 修改文件, 删除文件) 三个集合"""
+    added = set(new) - set(old)
+    removed = set(old) - set(new)
+    changed = {path for path in set(old) & set(new) if old[path] != new[path]}
+    return added, changed, removed
+
+def resample_group(data, n_nodes):
+    """把组别矩阵的每一行（一次试验）线性插值到 n_nodes 个等距节点
+
+    试验长度取每行最后一个非 NaN 值的位置，较短的试验在文件中以 NaN 补齐。所有
+    行一次完成插值：先计算每个目标节点在各行中的浮点位置，再用 take_along_axis
+    取左右相邻值，不逐行调用 np.interp。
+    """
+    data = np.asarray(data)
+    n_trials, n_points = data.shape
+    if n_points == 0:
+        raise ValueError("组别矩阵没有时间点")
+
+    valid = ~np.isnan(data)
+    lengths = np.where(valid.any(axis=1), n_points - np.argmax(valid[:, ::-1], axis=1), 0)
+    if n_points == n_nodes and (lengths == n_points).all():
+        return data
+
+    last = np.maximum(lengths - 1, 0)[:, None]
+    positions = np.linspace(0.0, 1.0, n_nodes)[None, :] * last
+    left = np.minimum(np.floor(positions).astype(np.intp), np.maximum(last - 1, 0))
+    right = np.minimum(left + 1, last)
+    weight = positions - left
+
+    y_left = np.take_along_axis(data, left, axis=1)
+    y_right = np.take_along_axis(data, right, axis=1)
+    resampled = y_left + weight * (y_right - y_left)
+    resampled[lengths == 0] = np.nan
+    return resampled.astype(data.dtype if data.dtype.kind == 'f' else np.float64, copy=False)
+
+def resample_groups(groups, n_nodes):
+    return {name: resample_group(data, n_nodes) for name, data in groups.items()}
+
+def prepare_groups(groups, resample_nodes=None, dtype=None):
+    """加载后处理：按需重采样，再转换为存储精度（如 float32）"""
+    if resample_nodes:
+        groups = resample_groups(groups, resample_nodes)
+    if dtype is not None:
+        groups = {name: data.astype(dtype, copy=False) for name, data in groups.items()}
+    return groups
+
+def _timed_load_file_groups(filepath, group_name):
+    """在工作进程/线程中解析单个文件，异常以字符串返回以便跨进程传递"""
+    start = time.perf_counter()
+    try:
+        groups = load_file_groups(filepath, group_name)
+        error = None
+    except Exception as e:
+        groups = None
+        error = str(e)
+    return groups, time.perf_counter() - start, error
+
+def load_group_files_parallel(tasks, max_workers=None, cache=None, resample_nodes=None, dtype=None):
+    """并行解析文件列表
+
+    tasks 为 [(指标, 组别, 文件路径), ...]。Excel 文件交给进程池（openpyxl 解析
+    受 GIL 限制），CSV 文件交给线程池，.npy/.npz 直接读取。指定 resample_nodes 时
+    解析后把每个组别重采样到该节点数，指定 dtype（如 float32）时转换存储精度，
+    原始数据与处理结果分别缓存。返回
+    ({(指标, 组别): ndarray}, 加载报告)，报告中每个文件一条记录，包含耗时、
+    是否命中缓存与失败原因。
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, int(max_workers))
+    if dtype is not None and np.dtype(dtype) == np.float64:
+        dtype = None
+    variant = (f"resample{resample_nodes}" if resample_nodes else '') + (np.dtype(dtype).name if dtype else '')
+
+    outcomes = {}
+    cached_tasks = set()
+    finished_tasks = set()
+    if cache is not None:
+        for task in tasks:
+            is_numpy = task[2].lower().endswith(NUMPY_EXTENSIONS)
+            start = time.perf_counter()
+            groups = None
+            if variant or not is_numpy:
+                groups = cache.get_groups(task[2], variant)
+                if groups is not None:
+                    finished_tasks.add(task)
+            if groups is None and variant and not is_numpy:
+                # 换了节点数时原始数据仍可从缓存读取，只需重新插值
+                groups = cache.get_groups(task[2])
+            if groups is None:
+                continue
+            if len(groups) == 1:
+                groups = {task[1]: next(iter(groups.values()))}
+            outcomes[task] = (groups, time.perf_counter() - start, None)
+            cached_tasks.add(task)
+    tasks_to_parse = [t for t in tasks if t not in cached_tasks]
+
+    excel_tasks = [t for t in tasks_to_parse if t[2].lower().endswith(EXCEL_EXTENSIONS)]
+    other_tasks = [t for t in tasks_to_parse if not t[2].lower().endswith(EXCEL_EXTENSIONS)]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as thread_pool:
+        futures = {thread_pool.submit(_timed_load_file_groups, t[2], t[1]): t for t in other_tasks}
+
+        if len(excel_tasks) > 1 and max_workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(max_workers, len(excel_tasks))) as process_pool:
+                    excel_futures = {process_pool.submit(_timed_load_file_groups, t[2], t[1]): t
+                                     for t in excel_tasks}
+                    for future in as_completed(excel_futures):
+                        outcomes[excel_futures[future]] = future.result()
+            except (BrokenProcessPool, OSError):
+                # 无法启动子进程时（如受限环境）退回线程池
+                pending = [t for t in excel_tasks if t not in outcomes]
+                futures.update({thread_pool.submit(_timed_load_file_groups, t[2], t[1]): t for t in pending})
+        else:
+            futures.update({thread_pool.submit(_timed_load_file_groups, t[2], t[1]): t for t in excel_tasks})
+
+        for future in as_completed(futures):
+            outcomes[futures[future]] = future.result()
+
+    loaded = {}
+    report = []
+    for task in tasks:
+        indicator_name, group_name, filepath = task
+        groups, seconds, error = outcomes[task]
+        if error is None and task not in finished_tasks:
+            if (cache is not None and task not in cached_tasks
+                    and not filepath.lower().endswith(NUMPY_EXTENSIONS)):
+                cache.put_groups(filepath, groups)
+            if variant:
+                start = time.perf_counter()
+                try:
+                    prepared = prepare_groups(groups, resample_nodes, dtype)
+                except ValueError as e:
+                    prepared, error = None, str(e)
+                else:
+                    # 未经改动的组别原样返回，无需再存一份
+                    if cache is not None and any(prepared[name] is not groups[name] for name in groups):
+                        cache.put_groups(filepath, prepared, variant)
+                groups = prepared
+                seconds += time.perf_counter() - start
+        if error is None:
+            duplicates = [name for name in groups if (indicator_name, name) in loaded]
+            if duplicates:
+                # 不同工作簿中同名的工作表会互相覆盖，整个文件报错跳过
+                error = (f"组别 {', '.join(duplicates)} 与同一指标下其他文件中的组别重名，"
+                         f"请重命名工作表或文件")
+        if error is None:
+            for name, data in groups.items():
+                loaded[(indicator_name, name)] = data
+        report.append({
+            'indicator': indicator_name,
+            'group': group_name,
+            'groups': list(groups) if groups else [],
+            'path': filepath,
+            'seconds': seconds,
+            'cached': task in cached_tasks,
+            'error': error,
+        })
+    return loaded, report
+
+def load_data_parallel(root_path, max_workers=None, cache=None, resample_nodes=None, dtype=None):
+    """并行加载全部指标，返回 ({指标: {组别: ndarray}}, 加载报告)"""
+    tree = scan_indicator_tree(root_path)
+    tasks = [(indicator_name, group_name, filepath)
+             for indicator_name, group_files in tree.items()
+             for group_name, filepath in group_files]
+
+    loaded, report = load_group_files_parallel(tasks, max_workers=max_workers, cache=cache,
+                                               resample_nodes=resample_nodes, dtype=dtype)
+
+    indicators = {}
+    for (indicator_name, group_name), data in loaded.items():
+        indicators.setdefault(indicator_name, {})[group_name] = data
+
+    return indicators, report
 
 def get_column_names(data_dict):
     if not data_dict:
@@ -65,22 +548,71 @@ def get_column_names(data_dict):
     first_group = list(data_dict[first_indicator].keys())[0]
     return list(data_dict[first_indicator][first_group].columns) if hasattr(data_dict[first_indicator][first_group], 'columns') else []
 
-def validate_data_structure(data_dict):
-    if not data_dict:
-        return False, "数据为空"
+def get_group_shapes(data_dict):
+    """返回 {指标: {组别: 形状}}；延迟加载的数据集直接使用表头扫描结果，不触发解析"""
+    if hasattr(data_dict, 'group_shapes'):
+        return data_dict.group_shapes()
+    return {indicator_name: {group_name: data.shape for group_name, data in groups.items()}
+            for indicator_name, groups in data_dict.items()}
 
-    for indicator_name, groups in data_dict.items():
+def find_timepoint_mismatches(shapes):
+    """按指标统计各组别时间点数，返回 {指标: {时间点数: [组别, ...]}}，只包含不一致的指标"""
+    mismatches = {}
+    for indicator_name, groups in shapes.items():
         timepoint_counts = {}
-        for group_name, data in groups.items():
-            timepoint_count = data.shape[1] if len(data.shape) > 1 else 0
+        for group_name, shape in groups.items():
+            timepoint_count = shape[1] if len(shape) > 1 else 0
             if timepoint_count not in timepoint_counts:
                 timepoint_counts[timepoint_count] = []
             timepoint_counts[timepoint_count].append(group_name)
 
         if len(timepoint_counts) > 1:
-            msg = f"指标 {indicator_name} 时间点数不一致:\n"
-            for count, groups_list in timepoint_counts.items():
-                msg += f"  - {count} 个时间点: {', '.join(groups_list)}\n"
-            return False, msg
+            mismatches[indicator_name] = timepoint_counts
+    return mismatches
+
+def format_timepoint_mismatch(indicator_name, timepoint_counts):
+    msg = f"指标 {indicator_name} 时间点数不一致:\n"
+    for count, groups_list in timepoint_counts.items():
+        msg += f"  - {count} 个时间点: {', '.join(groups_list)}\n"
+    return msg
+
+def validate_data_structure(data_dict):
+    if not data_dict:
+        return False, "数据为空"
+
+    mismatches = find_timepoint_mismatches(get_group_shapes(data_dict))
+    for indicator_name, timepoint_counts in mismatches.items():
+        return False, format_timepoint_mismatch(indicator_name, timepoint_counts)
 
     return True, "数据结构一致"
+
+def prescan_data_structure(root_path):
+    """只读取各文件表头检查数据结构，不解析数据
+
+    返回 {'shapes': {指标: {组别: (样本数, 时间点数)}}, 'paths': {指标: {组别: 文件路径}},
+    'mismatches': find_timepoint_mismatches 的结果, 'errors': [无法读取的文件],
+    'seconds': 耗时}。
+    """
+    start = time.perf_counter()
+    shapes = {}
+    paths = {}
+    errors = []
+    for indicator_name, group_files in scan_indicator_tree(root_path).items():
+        shapes[indicator_name] = {}
+        paths[indicator_name] = {}
+        for group_name, filepath in group_files:
+            try:
+                for name, info in scan_file_groups(filepath, group_name).items():
+                    shapes[indicator_name][name] = (info['n_rows'], info['n_cols'])
+                    paths[indicator_name][name] = filepath
+            except Exception as e:
+                errors.append({'indicator': indicator_name, 'group': group_name,
+                               'path': filepath, 'error': str(e)})
+
+    return {
+        'shapes': shapes,
+        'paths': paths,
+        'mismatches': find_timepoint_mismatches(shapes),
+        'errors': errors,
+        'seconds': time.perf_counter() - start,
+    }
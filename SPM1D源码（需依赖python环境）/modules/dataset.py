@@ -0,0 +1,257 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+import numpy as np
+from modules.data_loader import (scan_indicator_tree, scan_file_groups, load_group_files_parallel,
+                                 snapshot_tree, diff_snapshots)
+
+def _root_array(Y):
+    while isinstance(Y.base, np.ndarray):
+        Y = Y.base
+    return Y
+
+def _contiguous_rows(arrays, dtype):
+    """各组恰好是同一块 C 连续内存中前后相接的行时，返回覆盖全部行的视图，否则返回 None"""
+    if any(Y.dtype != dtype or not Y.flags.c_contiguous for Y in arrays):
+        return None
+    root = _root_array(arrays[0])
+    for prev, Y in zip(arrays, arrays[1:]):
+        if (_root_array(Y) is not root or
+                Y.__array_interface__['data'][0] != prev.__array_interface__['data'][0] + prev.nbytes):
+            return None
+    n_rows = sum(Y.shape[0] for Y in arrays)
+    return np.lib.stride_tricks.as_strided(arrays[0], shape=(n_rows, arrays[0].shape[1]),
+                                           writeable=False)
+
+class GroupedData(Mapping):
+    """一个指标全部组别的紧凑存储
+
+    各组别按顺序存放在同一个 C 连续矩阵 matrix 中，offsets 为各组的起止行，
+    dataset[组别] 返回对应行的只读视图而非副本；labels 为每一行所属组别的序号。
+    单因素 ANOVA、事后检验、正态性检验与绘图都直接使用这些视图，(matrix, labels)
+    即可作为合并设计，不再逐组堆叠复制。对外表现为 {组别: ndarray} 的只读映射。
+
+    各组已是同一块内存中相接的行（如单个组别、或取自另一个 GroupedData 的视图）时
+    matrix 直接是这块内存的视图。组别来自各自独立的内存映射文件（.npy 或磁盘缓存）
+    时不复制：合并到新矩阵会让常驻内存翻倍，此时 matrix 为 None，各组保留原映射，
+    合并设计在分析时临时堆叠。
+    """
+
+    def __init__(self, groups):
+        names = list(groups)
+        arrays = [np.asanyarray(groups[name]) for name in names]
+        dtype = np.result_type(*arrays) if arrays else np.float64
+        if dtype.kind != 'f':
+            dtype = np.float64
+        sizes = [Y.shape[0] for Y in arrays]
+        n_nodes = arrays[0].shape[1] if arrays else 0
+
+        self.offsets = np.concatenate([[0], np.cumsum(sizes, dtype=np.intp)])
+        self.labels = np.repeat(np.arange(len(names)), sizes)
+        self.matrix = _contiguous_rows(arrays, dtype) if arrays else None
+        if self.matrix is None and any(isinstance(Y, np.memmap) for Y in arrays):
+            self._views = {name: Y.view() for name, Y in zip(names, arrays)}
+            for Y in self._views.values():
+                Y.flags.writeable = False
+        else:
+            if self.matrix is None:
+                self.matrix = np.empty((int(self.offsets[-1]), n_nodes), dtype=dtype)
+                for i, Y in enumerate(arrays):
+                    self.matrix[self.offsets[i]:self.offsets[i + 1]] = Y
+                self.matrix.flags.writeable = False
+            self._views = {name: self.matrix[self.offsets[i]:self.offsets[i + 1]]
+                           for i, name in enumerate(names)}
+        # 内容指纹，由 result_cache.data_fingerprint 首次使用时填入
+        self.fingerprint = None
+
+    @classmethod
+    def from_groups(cls, groups):
+        """能合并时返回 GroupedData；组别为空、不是二维矩阵或时间点数不同时原样返回"""
+        if isinstance(groups, cls) or not groups:
+            return groups
+        shapes = [np.shape(Y) for Y in groups.values()]
+        if any(len(shape) != 2 for shape in shapes) or len({shape[1] for shape in shapes}) != 1:
+            return groups
+        return cls(groups)
+
+    def __getitem__(self, group_name):
+        return self._views[group_name]
+
+    def __iter__(self):
+        return iter(self._views)
+
+    def __len__(self):
+        return len(self._views)
+
+    def __contains__(self, group_name):
+        return group_name in self._views
+
+    @property
+    def nbytes(self):
+        if self.matrix is None:
+            return sum(Y.nbytes for Y in self._views.values())
+        return self.matrix.nbytes
+
+class LazyDataset(Mapping):
+    """按指标延迟加载的数据集
+
+    构造时只扫描目录结构和各文件表头（样本数、时间点数），指标的数据矩阵在首次
+    访问 dataset[指标] 时才并行解析。已加载的指标按最近使用顺序保留至多
+    max_loaded 个，超出时释放最久未用的指标。指定 resample_nodes 时每个组别在加载
+    时重采样到该节点数，指定 dtype（如 float32）时以该精度保存数据矩阵。每个指标的
+    组别以 GroupedData 合并存放在一个矩阵中。对外表现为 {指标: {组别: ndarray}}
+    的只读映射，可直接替代 load_data_parallel 返回的数据。
+    """
+
+    def __init__(self, root_path, max_loaded=2, max_workers=None, cache=None, resample_nodes=None,
+                 dtype=None):
+        self.root_path = root_path
+        self.resample_nodes = resample_nodes
+        self.dtype = dtype
+        self.max_loaded = max(1, int(max_loaded))
+        self.max_workers = max_workers
+        self.cache = cache
+        self.tree = scan_indicator_tree(root_path)
+        self.snapshot = snapshot_tree(self.tree)
+        self.metadata = {}
+        self.scan_report = []
+        self.load_report = []
+        self._loaded = OrderedDict()
+        self._scan_headers()
+
+    def _scan_headers(self):
+        for indicator_name, group_files in self.tree.items():
+            self._scan_indicator(indicator_name, group_files)
+
+    def _scan_indicator(self, indicator_name, group_files, unchanged=()):
+        """扫描一个指标的文件表头；unchanged 中的文件沿用已有的元数据"""
+        old_groups = self.metadata.get(indicator_name, {})
+        groups = {}
+        for group_name, filepath in group_files:
+            if filepath in unchanged:
+                groups.update({name: meta for name, meta in old_groups.items()
+                               if meta['path'] == filepath})
+                continue
+            entry = {'indicator': indicator_name, 'group': group_name,
+                     'path': filepath, 'error': None}
+            try:
+                file_groups = scan_file_groups(filepath, group_name)
+                duplicates = [name for name in file_groups if name in groups]
+                if duplicates:
+                    raise ValueError(f"组别 {', '.join(duplicates)} 与同一指标下其他文件中的组别重名，"
+                                     f"请重命名工作表或文件")
+                for name, info in file_groups.items():
+                    groups[name] = {'path': filepath,
+                                    'shape': (info['n_rows'], self.resample_nodes or info['n_cols']),
+                                    'exact': False}
+            except Exception as e:
+                entry['error'] = str(e)
+            self.scan_report.append(entry)
+        if groups:
+            self.metadata[indicator_name] = groups
+        else:
+            self.metadata.pop(indicator_name, None)
+
+    def __getitem__(self, indicator_name):
+        if indicator_name in self._loaded:
+            self._loaded.move_to_end(indicator_name)
+            return self._loaded[indicator_name]
+        if indicator_name not in self.metadata:
+            raise KeyError(indicator_name)
+        return self.load_indicator(indicator_name)
+
+    def __contains__(self, indicator_name):
+        return indicator_name in self.metadata
+
+    def __iter__(self):
+        return iter(self.metadata)
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def load_indicator(self, indicator_name):
+        """解析某个指标的全部组别文件，并按 LRU 释放多余的已加载指标"""
+        groups = GroupedData.from_groups(
+            self._load_files(indicator_name, {meta['path'] for meta in self.metadata[indicator_name].values()}))
+
+        self._loaded[indicator_name] = groups
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+        return groups
+
+    def _load_files(self, indicator_name, paths):
+        tasks = [(indicator_name, group_name, filepath)
+                 for group_name, filepath in self.tree[indicator_name] if filepath in paths]
+        loaded, report = load_group_files_parallel(tasks, max_workers=self.max_workers,
+                                                   cache=self.cache,
+                                                   resample_nodes=self.resample_nodes,
+                                                   dtype=self.dtype)
+        self.load_report.extend(report)
+
+        groups = {}
+        for (_, group_name), data in loaded.items():
+            groups[group_name] = data
+            meta = self.metadata[indicator_name].get(group_name)
+            if meta is not None:
+                meta['shape'] = data.shape
+                meta['exact'] = True
+        return groups
+
+    def refresh(self):
+        """与上次扫描比较文件的大小和修改时间，只重新扫描、解析新增或修改的文件
+
+        已加载的指标中未变化的组别保留原数组。返回受影响的指标集合，供调用方
+        作废这些指标下游的检验与分析结果。
+        """
+        tree = scan_indicator_tree(self.root_path)
+        snapshot = snapshot_tree(tree)
+        added, changed, removed = diff_snapshots(self.snapshot, snapshot)
+        touched = added | changed | removed
+
+        affected = {indicator_name for indicator_name in set(self.tree) | set(tree)
+                    if set(tree.get(indicator_name, [])) != set(self.tree.get(indicator_name, []))
+                    or any(path in changed for _, path in tree.get(indicator_name, []))}
+
+        self.tree = tree
+        self.snapshot = snapshot
+        self.scan_report = [r for r in self.scan_report if r['path'] not in touched]
+
+        for indicator_name in affected:
+            if indicator_name not in tree:
+                self.metadata.pop(indicator_name, None)
+                self._loaded.pop(indicator_name, None)
+                continue
+            unchanged = {path for _, path in tree[indicator_name] if path not in touched}
+            self._scan_indicator(indicator_name, tree[indicator_name], unchanged)
+
+            if indicator_name not in self._loaded:
+                continue
+            if indicator_name not in self.metadata:
+                self._loaded.pop(indicator_name)
+                continue
+            metadata = self.metadata[indicator_name]
+            old_groups = self._loaded[indicator_name]
+            kept = {name: old_groups[name] for name, meta in metadata.items()
+                    if meta['path'] in unchanged and name in old_groups}
+            stale = {meta['path'] for name, meta in metadata.items() if name not in kept}
+            reloaded = self._load_files(indicator_name, stale) if stale else {}
+            # 按 metadata 的组别顺序重建，与重新加载一致；组别顺序决定 t 检验的方向
+            groups = {name: kept[name] if name in kept else reloaded[name]
+                      for name in metadata if name in kept or name in reloaded}
+            groups.update((name, data) for name, data in reloaded.items() if name not in groups)
+            self._loaded[indicator_name] = GroupedData.from_groups(groups)
+
+        return affected
+
+    def is_loaded(self, indicator_name):
+        return indicator_name in self._loaded
+
+    def release(self, indicator_name):
+        self._loaded.pop(indicator_name, None)
+
+    def group_names(self, indicator_name):
+        return list(self.metadata.get(indicator_name, {}).keys())
+
+    def group_shapes(self):
+        """返回 {指标: {组别: (样本数, 时间点数)}}，未加载的指标为表头估计值"""
+        return {indicator_name: {group_name: meta['shape'] for group_name, meta in groups.items()}
+                for indicator_name, groups in self.metadata.items()}
@@ -1,53 +1,265 @@
 import numpy as np
-import spm1d
+from scipy import stats
+from scipy.special import gammaln
+from spm1d import rft1d
+from spm1d.stats._spm import SPM_X2
+from modules.dataset import GroupedData
 
-def dagostino_k2_normality(data):
-    J, Q = data.shape
-    if J < 8:
-        return None, "样本量小于8，无法使用K2检验"
-    
+K2_DF = (1, 2)
+EPS = np.finfo(float).eps
+
+def dagostino_k2_normality(data, alpha=0.05):
+    results, errors = dagostino_k2_batch({0: data}, alpha)
+    if 0 in errors:
+        return None, errors[0]
+    return results[0], None
+
+def _k2_from_moments(s1, s2, s3, s4, n):
+    """由各节点的幂和计算 D'Agostino-Pearson K² 统计量（逐元素，n 可广播）
+
+    与 spm1d.stats.normality.k2.k2_single_node 的公式一致，只是把逐节点的标量运算
+    改为对整个 (组别, 节点) 数组同时计算。
+    """
+    SS = s2 - (s1 ** 2 / n)
+    v = SS / (n - 1)
+    k3 = ((n * s3) - (3 * s1 * s2) + ((2 * (s1 ** 3)) / n)) / ((n - 1) * (n - 2))
+    g1 = k3 / (v ** 1.5)
+    k4 = ((n + 1) * ((n * s4) - (4 * s1 * s3) + (6 * (s1 ** 2) * (s2 / n)) - ((3 * (s1 ** 4)) / (n ** 2)))
+          / ((n - 1) * (n - 2) * (n - 3))) - ((3 * (SS ** 2)) / ((n - 2) * (n - 3)))
+    g2 = k4 / v ** 2
+    eg1 = ((n - 2) * g1) / (n * (n - 1)) ** 0.5
+
+    A = eg1 * (((n + 1) * (n + 3)) / (6 * (n - 2))) ** 0.5
+    B = (3 * ((n ** 2) + (27 * n) - 70) * ((n + 1) * (n + 3))) / ((n - 2) * (n + 5) * (n + 7) * (n + 9))
+    C = (2 * (B - 1)) ** 0.5 - 1
+    D = C ** 0.5
+    E = 1 / np.log(D) ** 0.5
+    F = A / (2 / (C - 1)) ** 0.5
+    Zg1 = E * np.log(F + (F ** 2 + 1) ** 0.5)
+
+    G = (24 * n * (n - 2) * (n - 3)) / ((n + 1) ** 2 * (n + 3) * (n + 5))
+    H = ((n - 2) * (n - 3) * g2) / ((n + 1) * (n - 1) * G ** 0.5)
+    J = ((6 * (n ** 2 - (5 * n) + 2)) / ((n + 7) * (n + 9))) * ((6 * (n + 3) * (n + 5)) / ((n * (n - 2) * (n - 3)))) ** 0.5
+    K = 6 + ((8 / J) * ((2 / J) + (1 + (4 / J ** 2)) ** 0.5))
+    L = (1 - (2 / K)) / (1 + H * (2 / (K - 4)) ** 0.5)
+    Zg2 = (1 - (2 / (9 * K)) - np.cbrt(L)) / (2 / (9 * K)) ** 0.5
+    return Zg1 ** 2 + Zg2 ** 2
+
+def k2_fields(residuals):
+    """批量计算 K² 统计场
+
+    residuals 为 {键: 残差矩阵 (样本数 x 时间点数)}。时间点数相同的矩阵按行补零
+    堆叠为 (组数, 最大样本数, 时间点数) 的数组，幂和、K² 与平滑度 (FWHM) 都在
+    堆叠数组上一次算出；补零的行对各项求和没有贡献。返回 {键: SPM_X2}。
+    """
+    by_nodes = {}
+    for key, r in residuals.items():
+        by_nodes.setdefault(r.shape[1], []).append(key)
+
+    fields = {}
+    for n_nodes, keys in by_nodes.items():
+        sizes = np.array([residuals[key].shape[0] for key in keys], dtype=float)
+        R = np.zeros((len(keys), int(sizes.max()), n_nodes))
+        for i, key in enumerate(keys):
+            R[i, :residuals[key].shape[0]] = residuals[key]
+
+        R2 = R * R
+        s1 = R.sum(axis=1)
+        s2 = R2.sum(axis=1)
+        s3 = (R2 * R).sum(axis=1)
+        s4 = (R2 * R2).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k2 = _k2_from_moments(s1, s2, s3, s4, sizes[:, None])
+
+            # 与 rft1d.geom.estimate_fwhm 相同：梯度法估计每个节点的粗糙度
+            dx = np.gradient(R, axis=2) if n_nodes > 1 else np.zeros_like(R)
+            v = (dx ** 2).sum(axis=1) / (s2 + EPS)
+            resels_per_node = np.sqrt(v / (4 * np.log(2)))
+            fwhm = 1 / np.nanmean(resels_per_node, axis=1)
+
+        for i, key in enumerate(keys):
+            r = residuals[key]
+            resels = rft1d.geom.resel_counts(r, fwhm[i], element_based=False)
+            fields[key] = SPM_X2(k2[i], K2_DF, fwhm[i], resels, residuals=r)
+    return fields
+
+def _rft_p_k2(u, resels, n_nodes):
+    """K² 场最大值超过 u 的 RFT 概率（含 Bonferroni 与 0D 校正），对 u、resels 逐元素计算"""
+    v = float(K2_DF[1])
+    sf = stats.chi2.sf(u, v)
+    ec0 = np.maximum(sf, EPS)
+    ec1 = np.maximum((4 * np.log(2) / (2 * np.pi)) ** 0.5
+                     * u ** ((v - 1) / 2) * np.exp(-u / 2 - gammaln(v / 2)) / (2 ** ((v - 2) / 2)), EPS)
+    expected = resels[:, 0] * ec0 + resels[:, 1] * ec1
+    p = 1 - np.exp(-(expected + EPS))
+    p = np.minimum(p, np.minimum(n_nodes * sf, 1))
+    return np.maximum(p, sf)
+
+def k2_thresholds(fields, alpha=0.05):
+    """批量求 K² 场的 RFT 临界阈值
+
+    与 SPM_X2.inference 中逐个调用 rft1d.chi2.isf_resels 的结果一致，但对所有场
+    同时做二分求根，取代逐个场的 Nelder-Mead 优化。返回 {键: zstar}。
+    """
+    keys = list(fields)
+    if not keys:
+        return {}
+    v = K2_DF[1]
+    resels = np.array([fields[key].resels for key in keys], dtype=float)
+    resels[resels[:, 1] == 0, 1] = EPS
+    n_nodes = np.array([fields[key].Q for key in keys], dtype=float)
+
+    # P(u) 介于 0D 概率与 Bonferroni 上界之间，由此确定求根区间
+    lo = np.full(len(keys), stats.chi2.isf(alpha, v))
+    hi = stats.chi2.isf(alpha / np.maximum(n_nodes, 1), v) + 1e-9
+    for _ in range(100):
+        mid = 0.5 * (lo + hi)
+        above = _rft_p_k2(mid, resels, n_nodes) > alpha
+        lo = np.where(above, mid, lo)
+        hi = np.where(above, hi, mid)
+        if np.all(hi - lo < 1e-12):
+            break
+    zstar = 0.5 * (lo + hi)
+    return {key: float(z) for key, z in zip(keys, zstar)}
+
+def inference_at_threshold(spm, zstar, **kwargs):
+    """以已求出的临界阈值 zstar 完成 spm1d 推断
+
+    spm1d 的 inference() 通过私有钩子 _isf 数值求解阈值；这里临时替换该钩子以复用
+    批量求出的阈值。当前 spm1d 没有该钩子、或替换后的阈值未被采用时，退回公开的
+    inference() 路径，结果相同只是较慢。
+    """
+    if not callable(getattr(type(spm), '_isf', None)):
+        return spm.inference(**kwargs)
+    spm._isf = lambda *args, **kw: zstar
     try:
-        result = spm1d.stats.normality.k2.ttest(data)
-        inference_result = result.inference(alpha=0.05)
-        
-        k2_values = result.z
-        if isinstance(k2_values, np.ndarray) and len(k2_values) > 0:
-            mean_k2 = np.mean(k2_values)
-        else:
-            mean_k2 = k2_values
-        
-        p_value = inference_result.p
-        if isinstance(p_value, (list, np.ndarray)) and len(p_value) > 0:
-            mean_p = np.mean(p_value)
+        inference_result = spm.inference(**kwargs)
+    finally:
+        del spm._isf
+    if not np.isclose(inference_result.zstar, zstar):
+        return spm.inference(**kwargs)
+    return inference_result
+
+def _summarize_k2(result, inference_result):
+    k2_values = result.z
+    if isinstance(k2_values, np.ndarray) and len(k2_values) > 0:
+        mean_k2 = np.mean(k2_values)
+    else:
+        mean_k2 = k2_values
+
+    p_value = inference_result.p
+    if isinstance(p_value, (list, np.ndarray)) and len(p_value) > 0:
+        mean_p = np.mean(p_value)
+    else:
+        mean_p = p_value
+
+    return {
+        'spm_result': result,
+        'inference_result': inference_result,
+        'k2_statistic': mean_k2,
+        'p_value': mean_p,
+        'is_normal': not inference_result.h0reject,
+        'h0reject': inference_result.h0reject,
+        'n_clusters': getattr(inference_result, 'nClusters', None),
+        'zstar': inference_result.zstar
+    }
+
+def dagostino_k2_batch(groups, alpha=0.05, center=True):
+    """一次计算多组（可跨指标）的 K² 正态性检验
+
+    groups 为 {键: 数据矩阵}，键可以是组别名或 (指标, 组别)。返回
+    ({键: 结果字典}, {键: 错误信息})，结果字典与 dagostino_k2_normality 相同。
+    传入的已是模型残差时设 center=False。
+    """
+    residuals = {}
+    errors = {}
+    for key, data in groups.items():
+        data = np.asarray(data, dtype=np.float64)
+        if data.shape[0] < 8:
+            errors[key] = "样本量小于8，无法使用K2检验"
         else:
-            mean_p = p_value
-        
-        is_normal = not inference_result.h0reject
-        
-        # 安全获取clusters属性
+            residuals[key] = data - data.mean(axis=0) if center else data
+
+    fields = k2_fields(residuals)
+    thresholds = k2_thresholds(fields, alpha)
+
+    results = {}
+    for key, result in fields.items():
         try:
-            n_clusters = getattr(inference_result, 'nClusters', None)
-            if n_clusters is None and hasattr(inference_result, 'clusters'):
-                clusters = inference_result.clusters
-                if clusters is not None:
-                    n_clusters = len(clusters) if isinstance(clusters, (list, tuple, np.ndarray)) else 1
-                else:
-                    n_clusters = 0
-        except:
-            n_clusters = None
-        
-        return {
-            'spm_result': result,
-            'inference_result': inference_result,
-            'k2_statistic': mean_k2,
-            'p_value': mean_p,
-            'is_normal': is_normal,
-            'h0reject': inference_result.h0reject,
-            'n_clusters': n_clusters,
-            'zstar': inference_result.zstar
-        }, None
-    except Exception as e:
-        return None, str(e)
+            inference_result = inference_at_threshold(result, thresholds[key], alpha=alpha)
+            results[key] = _summarize_k2(result, inference_result)
+        except Exception as e:
+            errors[key] = str(e)
+    return results, errors
+
+RESIDUAL_GROUP_NAME = '模型残差'
+
+def model_residuals(groups, test_type, **kwargs):
+    """按检验设计一次算出整个模型的残差矩阵，与 spm1d.stats.normality.k2 中对应函数一致
+
+    ttest2/anova1 为各组减去组均值后按组堆叠，ttest_paired 为配对差值减去均值，
+    ttest 为 y_data 减去均值，regress 为 y_data 对 x_data 的最小二乘残差。
+    """
+    if test_type in ('ttest2', 'anova1'):
+        if test_type == 'ttest2' and len(groups) != 2:
+            raise ValueError("独立样本t检验需要两组数据")
+        if isinstance(groups, GroupedData) and groups.matrix is not None:
+            Y = np.asarray(groups.matrix, dtype=np.float64)
+        else:
+            Y = np.concatenate([groups[g] for g in groups], axis=0, dtype=np.float64)
+        sizes = np.array([groups[g].shape[0] for g in groups])
+        starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        means = np.add.reduceat(Y, starts, axis=0) / sizes[:, None]
+        return Y - np.repeat(means, sizes, axis=0)
+
+    if test_type == 'ttest_paired':
+        if len(groups) != 2:
+            raise ValueError("配对样本t检验需要两组数据")
+        YA, YB = (np.asarray(groups[g], dtype=np.float64) for g in groups)
+        if YA.shape != YB.shape:
+            raise ValueError("配对样本t检验要求两组样本数和时间点数相同")
+        d = YA - YB
+        return d - d.mean(axis=0)
+
+    if test_type == 'ttest':
+        Y = kwargs.get('y_data')
+        if Y is None:
+            Y = groups[next(iter(groups))]
+        Y = np.asarray(Y, dtype=np.float64)
+        return Y - Y.mean(axis=0)
+
+    if test_type == 'regress':
+        Y = np.asarray(kwargs.get('y_data'), dtype=np.float64)
+        x = np.asarray(kwargs.get('x_data'), dtype=np.float64).ravel()
+        X = np.column_stack([x, np.ones(x.size)])
+        beta = np.linalg.lstsq(X, Y, rcond=None)[0]
+        return Y - X @ beta
+
+    raise ValueError(f"不支持的分析类型: {test_type}")
+
+def residual_normality_test(groups, test_type, alpha=0.05, **kwargs):
+    """对整个检验设计的模型残差做一次 K² 检验
+
+    返回与 run_normality_tests 相同结构的字典，groups 中只有一项“模型残差”。
+    """
+    residuals = model_residuals(groups, test_type, **kwargs)
+    batch, errors = dagostino_k2_batch({RESIDUAL_GROUP_NAME: residuals}, alpha, center=False)
+    entry = _normality_entry(batch.get(RESIDUAL_GROUP_NAME), errors.get(RESIDUAL_GROUP_NAME), alpha)
+    results = {RESIDUAL_GROUP_NAME: entry}
+
+    recommendation = recommend_test_method(results, alpha)
+    if entry.get('is_normal'):
+        recommendation['reason'] = "模型残差符合正态分布，建议使用参数检验"
+    elif 'error' not in entry:
+        recommendation['reason'] = "模型残差不符合正态分布，建议使用非参数检验"
+
+    return {
+        'groups': results,
+        'recommendation': recommendation,
+        'alpha': alpha,
+        'mode': 'residuals',
+        'test_type': test_type
+    }
 
 def recommend_test_method(normality_results, alpha=0.05):
     normal_groups = []
@@ -84,21 +296,45 @@ def recommend_test_method(normality_results, alpha=0.05):
         'abnormal_groups': abnormal_groups
     }
 
+def _normality_entry(result, error, alpha):
+    if error:
+        return {'error': error, 'is_normal': None}
+    result['alpha'] = alpha
+    return result
+
+def test_group_normality(data, alpha=0.05):
+    """检验单个组别，返回 run_normality_tests 结果中 groups 下的一项"""
+    result, error = dagostino_k2_normality(data, alpha)
+    return _normality_entry(result, error, alpha)
+
+def group_normality_entries(groups, alpha=0.05):
+    """批量检验一个指标中的若干组别，返回 {组别: run_normality_tests 结果中 groups 下的一项}"""
+    batch, errors = dagostino_k2_batch(groups, alpha)
+    return {name: _normality_entry(batch.get(name), errors.get(name), alpha) for name in groups}
+
 def run_normality_tests(merged_data, alpha=0.05):
-    results = {}
-    
-    for group_name, data in merged_data.items():
-        result, error = dagostino_k2_normality(data)
-        if error:
-            results[group_name] = {'error': error, 'is_normal': None}
-        else:
-            result['alpha'] = alpha
-            results[group_name] = result
-    
-    recommendation = recommend_test_method(results, alpha)
-    
-    return {
-        'groups': results,
-        'recommendation': recommendation,
-        'alpha': alpha
-    }
+    return run_normality_tests_batch({None: merged_data}, alpha)[None]
+
+def run_normality_tests_batch(indicators, alpha=0.05):
+    """对多个指标的全部组别一次完成正态性检验
+
+    indicators 为 {指标: {组别: ndarray}}，返回 {指标: run_normality_tests 的结果}。
+    """
+    keyed = {(indicator_name, group_name): data
+             for indicator_name, groups in indicators.items()
+             for group_name, data in groups.items()}
+    batch, errors = dagostino_k2_batch(keyed, alpha)
+
+    output = {}
+    for indicator_name, groups in indicators.items():
+        results = {}
+        for group_name in groups:
+            key = (indicator_name, group_name)
+            results[group_name] = _normality_entry(batch.get(key), errors.get(key), alpha)
+
+        output[indicator_name] = {
+            'groups': results,
+            'recommendation': recommend_test_method(results, alpha),
+            'alpha': alpha
+        }
+    return output
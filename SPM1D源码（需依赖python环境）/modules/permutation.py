@@ -0,0 +1,343 @@
+import os
+import itertools
+from math import ceil
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from spm1d.stats.nonparam.calculators import CalculatorTtest, CalculatorTtest2, CalculatorANOVA1
+from spm1d.stats.nonparam.factors import Factor
+from spm1d.stats.nonparam.metrics import MaxClusterIntegral
+from spm1d.stats.nonparam.util import permutations_without_repetition
+from utils.config import DEFAULT_SETTINGS
+
+# 每个随机数流负责的置换数。置换集合由 (种子, 流, 块序号) 决定，与进程数无关；
+# 修改此值会改变给定种子下的置换集合。
+PERMUTATION_BLOCK = 1000
+
+def _block_size(n_rows, n_nodes, n_buffers, memory_mb):
+    """每块置换数：使块内 n_buffers 个 (块大小 x 时间点) 的 float64 矩阵不超过内存预算"""
+    per_perm = max(n_nodes * n_buffers * 8, 1)
+    return int(max(1, min(n_rows, memory_mb * 1024 * 1024 // per_perm)))
+
+def sign_flip_t_fields(y, signs, memory_mb=None):
+    """单样本（及配对）t检验：每行 signs 为一组 ±1 翻转，返回 (置换数 x 时间点) 的 t 场
+
+    翻转不改变平方和，因此每块只需一次矩阵乘法求均值。
+    """
+    memory_mb = memory_mb or DEFAULT_SETTINGS['permutation_memory_mb']
+    y = np.asarray(y, dtype=np.float64)
+    signs = np.asarray(signs, dtype=np.float64)
+    J = y.shape[0]
+    ssq = (y * y).sum(axis=0)
+    block = _block_size(signs.shape[0], y.shape[1], 3, memory_mb)
+    ZZ = np.empty((signs.shape[0], y.shape[1]))
+    for start in range(0, signs.shape[0], block):
+        m = signs[start:start + block] @ y / J
+        var = (ssq - J * m * m) / (J - 1)
+        ZZ[start:start + block] = m / np.sqrt(var / J)
+    return ZZ
+
+def _group_sums(y, labels, levels):
+    return [(labels == level).astype(np.float64) @ y for level in levels]
+
+def label_t2_fields(y, labels, memory_mb=None):
+    """两样本t检验（合并方差）：每行 labels 为一组 0/1 组别置换，返回 t 场"""
+    memory_mb = memory_mb or DEFAULT_SETTINGS['permutation_memory_mb']
+    y = np.asarray(y, dtype=np.float64)
+    y = y - y.mean(axis=0)  # 平移不改变 t 值，先中心化以减小平方和相减的舍入误差
+    labels = np.asarray(labels)
+    n1 = int((labels[0] == 1).sum())
+    n0 = labels.shape[1] - n1
+    total, total_ssq = y.sum(axis=0), (y * y).sum(axis=0)
+    df = n0 + n1 - 2
+    scale = (1.0 / n0 + 1.0 / n1) ** 0.5
+    block = _block_size(labels.shape[0], y.shape[1], 6, memory_mb)
+    ZZ = np.empty((labels.shape[0], y.shape[1]))
+    for start in range(0, labels.shape[0], block):
+        mask = (labels[start:start + block] == 1).astype(np.float64)
+        s1, q1 = mask @ y, mask @ (y * y)
+        m1, m0 = s1 / n1, (total - s1) / n0
+        ss = (q1 - n1 * m1 * m1) + (total_ssq - q1 - n0 * m0 * m0)
+        ZZ[start:start + block] = (m0 - m1) / np.sqrt(ss / df) / scale
+    return ZZ
+
+def label_anova1_fields(y, labels, memory_mb=None):
+    """单因素ANOVA：每行 labels 为一组组别置换，返回 F 场"""
+    memory_mb = memory_mb or DEFAULT_SETTINGS['permutation_memory_mb']
+    y = np.asarray(y, dtype=np.float64)
+    y = y - y.mean(axis=0)
+    labels = np.asarray(labels)
+    levels, counts = np.unique(labels[0], return_counts=True)
+    J, k = labels.shape[1], levels.size
+    sst = (y * y).sum(axis=0)
+    block = _block_size(labels.shape[0], y.shape[1], k + 2, memory_mb)
+    ZZ = np.empty((labels.shape[0], y.shape[1]))
+    for start in range(0, labels.shape[0], block):
+        sums = _group_sums(y, labels[start:start + block], levels)
+        ssb = sum(s * s / n for s, n in zip(sums, counts))
+        ZZ[start:start + block] = (ssb / (k - 1)) / ((sst - ssb) / (J - k))
+    return ZZ
+
+def pairwise_t_fields(y, labels, pairs, memory_mb=None):
+    """单因素设计的全部组对：每行 labels 为一组组别置换，返回 (组对数 x 置换数 x 时间点) 的两样本t场
+
+    每组的和与平方和只算一次，各组对的 t 场（合并方差，前组减后组）由组统计量直接
+    相减得到。pairs 为 (组别a, 组别b) 标签对的列表。
+    """
+    memory_mb = memory_mb or DEFAULT_SETTINGS['permutation_memory_mb']
+    y = np.asarray(y, dtype=np.float64)
+    y = y - y.mean(axis=0)
+    yy = y * y
+    labels = np.asarray(labels)
+    levels, counts = np.unique(labels[0], return_counts=True)
+    index = {level: i for i, level in enumerate(levels)}
+    n = counts.astype(np.float64)
+
+    ia = np.array([index[la] for la, _ in pairs])
+    ib = np.array([index[lb] for _, lb in pairs])
+    scale = ((1.0 / n[ia] + 1.0 / n[ib]) / (n[ia] + n[ib] - 2))[:, None, None]
+
+    B, J, Q, k = labels.shape[0], labels.shape[1], y.shape[1], levels.size
+    block = _block_size(B, Q, 3 * k + 3 * len(pairs), memory_mb)
+    T = np.empty((len(pairs), B, Q))
+    for start in range(0, B, block):
+        chunk = labels[start:start + block]
+        size = chunk.shape[0]
+        masks = (chunk[None, :, :] == levels[:, None, None]).astype(np.float64).reshape(-1, J)
+        sums = (masks @ y).reshape(k, size, Q)
+        means = sums / n[:, None, None]
+        ss = (masks @ yy).reshape(k, size, Q) - sums * means
+        # 全部组对一次相减，不逐对循环
+        pooled = ss[ia] + ss[ib]
+        pooled *= scale
+        np.sqrt(pooled, out=pooled)
+        out = T[:, start:start + size]
+        np.subtract(means[ia], means[ib], out=out)
+        out /= pooled
+    return T
+
+def shared_posthoc_null(y, base, pairs, iterations, seed=None, memory_mb=None):
+    """全部组对共用一套组别置换的事后检验零分布（最大统计量法）
+
+    base 为合并后的单因素ANOVA组别标签。置换按 permutation_fields 的分块与种子
+    规则生成，给定相同 seed 时与主效应 ANOVA 使用同一套置换；不同置换总数不超过
+    iterations 时改为精确枚举。返回 (ZZ, secondary, n)：ZZ 为每个置换中各组对
+    |t| 在每个时间点的最大值，secondary(zstar) 返回各置换中全部组对聚类积分的
+    最大值，n 为置换数。
+    """
+    memory_mb = memory_mb or DEFAULT_SETTINGS['permutation_memory_mb']
+    base = np.asarray(base)
+    n_unique = Factor(base).ncomb
+    if n_unique <= iterations:
+        labels = exact_permutations('anova1', base)
+    else:
+        labels = np.vstack([_random_labels(_block_rng(seed, (), i), base, min(PERMUTATION_BLOCK, iterations - start))
+                            for i, start in enumerate(range(0, iterations, PERMUTATION_BLOCK))])
+
+    B, Q = labels.shape[0], y.shape[1]
+    chunk = _block_size(B, Q, 4 * len(pairs), memory_mb)
+    # 聚类分布只与含超阈值点的 (组对, 置换) t 场有关：计算时在内存上限内保留峰值 |t|
+    # 最大的一批场，floor 为舍弃场峰值的上界，阈值不低于 floor 时无需重算 t 场
+    budget = max(1, memory_mb * 1024 * 1024 // (8 * Q))
+    kept = []
+    n_kept = 0
+    floor = -np.inf
+    ZZ = []
+    for start in range(0, B, chunk):
+        T = pairwise_t_fields(y, labels[start:start + chunk], pairs, memory_mb)
+        A = np.abs(T)
+        ZZ.append(A.max(axis=0))
+        peaks = A.max(axis=2)
+        pair_idx, perm_idx = np.nonzero(peaks > floor)
+        kept.append((T[pair_idx, perm_idx], start + perm_idx, peaks[pair_idx, perm_idx]))
+        n_kept += pair_idx.size
+        if n_kept > budget:
+            fields, perms, row_peaks = (np.concatenate(parts) for parts in zip(*kept))
+            order = np.argpartition(row_peaks, n_kept - budget)
+            floor = max(floor, row_peaks[order[:n_kept - budget]].max())
+            top = order[n_kept - budget:]
+            kept = [(fields[top], perms[top], row_peaks[top])]
+            n_kept = budget
+    ZZ = np.vstack(ZZ)
+    fields, perms, _ = (np.concatenate(parts) for parts in zip(*kept))
+    cache = {}
+
+    def secondary(zstar):
+        if zstar not in cache:
+            if zstar >= floor:
+                Z2 = np.zeros(B)
+                np.maximum.at(Z2, perms, max_cluster_integrals(fields, zstar))
+            else:
+                Z2 = []
+                for start in range(0, B, chunk):
+                    T = pairwise_t_fields(y, labels[start:start + chunk], pairs, memory_mb)
+                    P, b, _ = T.shape
+                    Z2.append(max_cluster_integrals(T.reshape(P * b, Q), zstar).reshape(P, b).max(axis=0))
+                Z2 = np.concatenate(Z2)
+            cache[zstar] = Z2
+        return cache[zstar]
+
+    return ZZ, secondary, labels.shape[0]
+
+def install_shared_null(snpm, ZZ, secondary):
+    """让 spm1d 非参数两样本t检验使用外部给定的置换分布（如 shared_posthoc_null 的结果）
+
+    临界阈值、聚类与聚类 p 值仍由 spm1d 原有流程计算。
+    """
+    mgr = snpm.mgr
+
+    def permute(niter=-1, two_tailed=False):
+        mgr._two_tailed = two_tailed
+        mgr.ZZ = ZZ
+
+    def build_secondary_pdf(zstar, circular=False):
+        mgr.Z2 = secondary(zstar)
+
+    mgr.permute = permute
+    mgr.build_secondary_pdf = build_secondary_pdf
+
+def max_cluster_integrals(ZZ, thresh):
+    """每个置换场中超阈值聚类积分的最大值，与 spm1d MaxClusterIntegral 一致
+
+    把所有行首尾相接（行间以一个空位隔开）后一次标记全部聚类，再按行取最大值。
+    """
+    ZZ = np.asarray(ZZ, dtype=np.float64)
+    out = np.zeros(ZZ.shape[0])
+    # 没有超阈值点的行聚类积分为 0，只对其余行标记聚类
+    hit = np.flatnonzero((ZZ > thresh).any(axis=1))
+    if hit.size == 0:
+        return out
+    ZZ = ZZ[hit]
+    B, Q = ZZ.shape
+    d = np.zeros((B, Q + 1))
+    d[:, :Q] = ZZ - thresh
+    d = d.ravel()
+    above = d > 0
+    starts = above & ~np.concatenate([[False], above[:-1]])
+    start_pos = np.flatnonzero(starts)
+
+    run_id = np.cumsum(starts)[above] - 1
+    sums = np.bincount(run_id, weights=d[above], minlength=start_pos.size)
+    lengths = np.bincount(run_id, minlength=start_pos.size)
+    end_pos = start_pos + lengths - 1
+    metric = np.where(lengths > 1, sums - 0.5 * (d[start_pos] + d[end_pos]), sums)
+    np.maximum.at(out, hit[start_pos // (Q + 1)], metric)
+    return out
+
+def exact_permutations(kind, base, two_tailed=False):
+    """枚举全部不同的置换，顺序与 spm1d 的 combinations / combinations_half 相同
+
+    符号翻转由 0..2^n-1 的位掩码整块生成；组别标签按 spm1d 的无重复排列生成。
+    双侧检验与 spm1d 一样只取前一半。
+    """
+    if kind == 'ttest':
+        n = int(base)
+        count = 2 ** (n - 1) if two_tailed else 2 ** n
+        bits = (np.arange(count)[:, None] >> np.arange(n - 1, -1, -1)) & 1
+        return 1 - 2 * bits
+
+    labels = permutations_without_repetition(base)
+    if two_tailed:
+        labels = itertools.islice(labels, ceil(Factor(base).ncomb / 2))
+    return np.array(list(labels))
+
+def _block_rng(seed, stream, index):
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=tuple(stream) + (index,)))
+
+def _random_labels(rng, base, size):
+    return rng.permuted(np.tile(base, (size, 1)), axis=1)
+
+def _permutation_block(kind, y, base, seed, stream, index, size, memory_mb):
+    rng = _block_rng(seed, stream, index)
+    if kind == 'ttest':
+        signs = rng.integers(0, 2, size=(size, base)) * 2 - 1
+        return sign_flip_t_fields(y, signs, memory_mb)
+    labels = _random_labels(rng, base, size)
+    if kind == 'ttest2':
+        return label_t2_fields(y, labels, memory_mb)
+    return label_anova1_fields(y, labels, memory_mb)
+
+def permutation_fields(kind, y, base, iterations, seed, stream=(), workers=None, memory_mb=None,
+                       block_size=PERMUTATION_BLOCK, first_block=0):
+    """按固定大小分块生成随机置换并计算统计场，返回 (置换数 x 时间点)
+
+    kind 为 'ttest'（base 为样本数，符号翻转）、'ttest2' 或 'anova1'（base 为组别标签）。
+    每块使用由 seed、stream 与块序号派生的独立随机数流，多块时分给进程池并按块序号
+    拼接，因此无论进程数多少结果都逐位相同。first_block 指定第一块的序号，用于在
+    已生成的块之后继续追加。
+    """
+    memory_mb = memory_mb or DEFAULT_SETTINGS['permutation_memory_mb']
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, int(workers))
+
+    sizes = [min(block_size, iterations - start) for start in range(0, iterations, block_size)]
+    tasks = [(kind, y, base, seed, tuple(stream), first_block + i, size, memory_mb)
+             for i, size in enumerate(sizes)]
+
+    if workers > 1 and len(tasks) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                return np.vstack(list(pool.map(_permutation_block, *zip(*tasks))))
+        except (BrokenProcessPool, OSError):
+            # 无法启动子进程时（如受限环境）在当前进程内计算，结果相同
+            pass
+    return np.vstack([_permutation_block(*task) for task in tasks])
+
+def install_batched_permuter(snpm, memory_mb=None, seed=None, stream=(), workers=None):
+    """让 spm1d 非参数 SPM 的置换分布改由分块矩阵运算计算
+
+    置换序列仍由 spm1d 自身的置换器按同样的随机数顺序生成，因此在相同随机种子下
+    得到与 spm1d 相同的置换集合、临界阈值与聚类 p 值。只支持 ttest、ttest_paired、
+    ttest2 与 anova1；穷举置换（iterations=-1）由 exact_permutations 整块生成，
+    ROI 仍由 spm1d 原有实现处理。
+    聚类积分分布（默认聚类指标、非环形场）同样改为整块计算。
+
+    给定 seed 时不再使用全局随机数，而由 permutation_fields 按 seed 与 stream
+    派生的随机数流生成置换，并可用 workers 个进程并行计算，同时在 mgr 上提供
+    seeded_fields(iterations, block_size, first_block) 供分批追加置换。返回是否已替换。
+    """
+    mgr = getattr(snpm, 'mgr', None)
+    if mgr is None or getattr(mgr, 'dim', 0) != 1 or mgr.hasroi:
+        return False
+
+    calc = mgr.calc
+    y = np.asarray(mgr.y, dtype=np.float64)
+    if isinstance(calc, CalculatorTtest):
+        kind, y, base = 'ttest', y - calc.mu, y.shape[0]
+        fields = lambda perms: sign_flip_t_fields(y, perms, memory_mb)
+    elif isinstance(calc, CalculatorTtest2):
+        kind, base = 'ttest2', mgr.permuter._factors[0].A
+        fields = lambda perms: label_t2_fields(y, perms, memory_mb)
+    elif isinstance(calc, CalculatorANOVA1):
+        kind, base = 'anova1', mgr.permuter._factors[0].A
+        fields = lambda perms: label_anova1_fields(y, perms, memory_mb)
+    else:
+        return False
+
+    permuter = mgr.permuter
+
+    def permute(niter=-1, two_tailed=False):
+        mgr._two_tailed = two_tailed
+        if niter == -1:
+            mgr.ZZ = fields(exact_permutations(kind, base, two_tailed))
+        elif seed is None:
+            perms = np.array([permuter.random()[0] for _ in range(niter)])
+            mgr.ZZ = fields(perms)
+        else:
+            mgr.ZZ = permutation_fields(kind, y, base, niter, seed, stream, workers, memory_mb)
+
+    def build_secondary_pdf(zstar, circular=False):
+        if circular or not isinstance(mgr.metric, MaxClusterIntegral):
+            return type(mgr).build_secondary_pdf(mgr, zstar, circular)
+        mgr.Z2 = max_cluster_integrals(mgr.ZZ, zstar)
+
+    def seeded_fields(iterations, block_size=PERMUTATION_BLOCK, first_block=0):
+        return permutation_fields(kind, y, base, iterations, seed, stream, workers, memory_mb,
+                                  block_size, first_block)
+
+    mgr.permute = permute
+    mgr.build_secondary_pdf = build_secondary_pdf
+    if seed is not None:
+        mgr.seeded_fields = seeded_fields
+    return True
@@ -0,0 +1,270 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from modules.dataset import GroupedData
+from modules.spm_analysis import SPMAnalyzer, LazyPosthocResults, summarize_posthoc
+from utils.config import DEFAULT_SETTINGS
+
+ANALYSIS_SEED = DEFAULT_SETTINGS['random_seed']
+
+def _array_digest(h, Y):
+    Y = np.ascontiguousarray(Y)
+    h.update(f"{Y.shape}|{Y.dtype.str}|".encode('utf-8'))
+    h.update(Y)
+
+def data_fingerprint(data):
+    """组别数据的内容指纹：组名、形状、精度与数值都参与计算
+
+    GroupedData 的矩阵只读，数据更新时整体替换为新对象，指纹算一次后存在对象上，
+    界面线程反复取缓存时不再重新哈希。
+    """
+    if getattr(data, 'fingerprint', None) is not None:
+        return data.fingerprint
+    h = hashlib.sha1()
+    for name, Y in data.items():
+        h.update(f"{name}|".encode('utf-8'))
+        _array_digest(h, Y)
+    fingerprint = h.hexdigest()
+    if isinstance(data, GroupedData):
+        data.fingerprint = fingerprint
+    return fingerprint
+
+def _value_fingerprint(value):
+    if value is None:
+        return None
+    if isinstance(value, np.ndarray):
+        h = hashlib.sha1()
+        _array_digest(h, value)
+        return h.hexdigest()
+    return repr(value)
+
+def _estimate_nbytes(value, depth=5, seen=None):
+    """缓存值持有的数组字节数（粗略）：沿容器与对象属性向下累计 ndarray，不计共享的组别数据"""
+    if seen is None:
+        seen = set()
+    if id(value) in seen or isinstance(value, GroupedData):
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if depth == 0:
+        return 0
+    if isinstance(value, dict):
+        children = value.values()
+    elif isinstance(value, (list, tuple)):
+        children = value
+    elif hasattr(value, '__dict__'):
+        children = vars(value).values()
+    else:
+        return 0
+    return sum(_estimate_nbytes(child, depth - 1, seen) for child in children)
+
+class ResultCache:
+    """SPM 分析与事后检验结果的内存缓存
+
+    以 数据指纹 + 检验类型 + 方法 + α + 迭代次数 + 随机种子 作为键，条目数超过
+    max_entries 或估计占用超过 max_bytes 后淘汰最久未使用的结果（至少保留最新一项；
+    按需计算的事后检验在放入后才补算的组对不计入）。另以不含 α 的键保存已算好统计场的
+    SPMAnalyzer，只改 α 时据此重新推断，事后检验也复用其中的合并设计与组统计量。
+    分析线程与界面线程共用，读写加锁。
+    """
+
+    def __init__(self, max_entries=16, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        nbytes = _estimate_nbytes(value)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = nbytes
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or
+                                              (self.max_bytes is not None and
+                                               self.nbytes > self.max_bytes)):
+                old_key, _ = self._entries.popitem(last=False)
+                del self._sizes[old_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    @property
+    def nbytes(self):
+        return sum(self._sizes.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+def _design_key(data, params, method, seed):
+    test_type = params.get('test_type')
+    iterations = params.get('iterations', 500) if method == 'nonparam' else None
+    if method == 'nonparam' and params.get('adaptive'):
+        iterations = ('adaptive', iterations, params.get('mc_precision'))
+    extras = tuple(_value_fingerprint(params.get(name))
+                   for name in ('y_data', 'mu_data', 'x_data'))
+    return (data_fingerprint(data), test_type, method, iterations, seed, extras)
+
+def analysis_key(data, params, method, seed=ANALYSIS_SEED):
+    return ('analysis',) + _design_key(data, params, method, seed) + (params.get('alpha'),)
+
+def field_key(data, params, method, seed=ANALYSIS_SEED):
+    """与 α 无关的部分：统计场及非参数置换分布只由它决定"""
+    return ('field',) + _design_key(data, params, method, seed)
+
+def posthoc_key(data, method, alpha, seed=ANALYSIS_SEED, correction='bonferroni'):
+    return ('posthoc', data_fingerprint(data), 'anova1', method, alpha, None, seed, correction)
+
+_rethreshold_lock = threading.Lock()
+
+def _build_analyzer(data, params, method, seed):
+    test_type = params.get('test_type')
+    kwargs = {'seed': seed}
+    if method == 'nonparam':
+        kwargs['iterations'] = params.get('iterations', 500)
+    if test_type == 'ttest':
+        kwargs['y_data'] = params.get('y_data')
+        kwargs['mu_data'] = params.get('mu_data', 0)
+    if test_type == 'regress':
+        kwargs['y_data'] = params.get('y_data')
+        kwargs['x_data'] = params.get('x_data')
+
+    return SPMAnalyzer(data, test_type=test_type,
+                       method='param' if test_type == 'regress' else method, **kwargs)
+
+def _inference_kwargs(analyzer, params):
+    if analyzer.method == 'param':
+        return {} if analyzer.test_type == 'anova1' else {'two_tailed': True}
+    kwargs = {'iterations': params.get('iterations', 500)}
+    if params.get('adaptive'):
+        kwargs['adaptive'] = True
+        kwargs['precision'] = params.get('mc_precision', DEFAULT_SETTINGS['adaptive_precision'])
+    return kwargs
+
+def _infer(cache, data, params, method, seed, alpha):
+    """返回 (analyzer, inference_result, summary)
+
+    同一数据与设计的统计场已算过时，直接在缓存的 analyzer 上按新 α 重新推断。
+    """
+    key = field_key(data, params, method, seed) if cache is not None else None
+    analyzer = cache.get(key) if cache is not None else None
+    if analyzer is not None:
+        with _rethreshold_lock:
+            inference_result, error = analyzer.rethreshold(alpha, **_inference_kwargs(analyzer, params))
+            summary = analyzer.get_results_summary()
+        if error:
+            raise Exception(error)
+        return analyzer, inference_result, summary
+
+    analyzer = _build_analyzer(data, params, method, seed)
+
+    spm_result, error = analyzer.run_analysis()
+    if error:
+        raise Exception(error)
+
+    inference_result, error = analyzer.inference(alpha=alpha, **_inference_kwargs(analyzer, params))
+    if error:
+        raise Exception(error)
+
+    summary = analyzer.get_results_summary()
+    if cache is not None:
+        cache.put(key, analyzer)
+    return analyzer, inference_result, summary
+
+def run_analysis_cached(cache, data, params, method, seed=ANALYSIS_SEED):
+    """运行（或从缓存取出）一次 SPM 分析，返回 (summary, spm_result, inference_result)
+
+    失败时抛出异常；cache 为 None 时不使用缓存。
+    """
+    key = analysis_key(data, params, method, seed) if cache is not None else None
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        summary, spm_result, inference_result = cached
+        return dict(summary), spm_result, inference_result
+
+    analyzer, inference_result, summary = _infer(cache, data, params, method, seed, params['alpha'])
+    spm_result = analyzer.spm_result
+
+    if params.get('test_type') == 'regress':
+        summary['y_data'] = params.get('y_data')
+        summary['y_name'] = params.get('y_name')
+        summary['x_name'] = params.get('x_name')
+
+    if cache is not None:
+        cache.put(key, (summary, spm_result, inference_result))
+    return dict(summary), spm_result, inference_result
+
+def analysis_session(cache, data, params, method, seed=ANALYSIS_SEED):
+    """取得数据与设计对应的 SPMAnalyzer 会话
+
+    运行过分析时直接取缓存中的 analyzer，其合并设计矩阵、主效应统计场与组统计量
+    供事后检验与绘图复用；缓存中没有时新建并只计算统计场，不做推断，也不放入缓存。
+    """
+    analyzer = cache.get(field_key(data, params, method, seed)) if cache is not None else None
+    if analyzer is not None:
+        return analyzer
+
+    analyzer = _build_analyzer(data, params, method, seed)
+    spm_result, error = analyzer.run_analysis()
+    if error:
+        raise Exception(error)
+    return analyzer
+
+def alpha_sweep_cached(cache, data, params, method, alphas, seed=ANALYSIS_SEED):
+    """在多个 α 下报告同一分析的阈值与聚类结果，统计场与置换分布只计算一次"""
+    analyzer, _, _ = _infer(cache, data, params, method, seed, params['alpha'])
+    with _rethreshold_lock:
+        rows, error = analyzer.alpha_sweep(alphas, **_inference_kwargs(analyzer, params))
+    if error:
+        raise Exception(error)
+    return rows
+
+def run_posthoc_cached(cache, data, method, alpha=0.05, seed=ANALYSIS_SEED, on_pair=None,
+                       correction='bonferroni', lazy=False, params=None):
+    """运行（或从缓存取出）单因素ANOVA事后检验，返回 (summary, posthoc_results, spm_result)
+
+    on_pair 在每个组对算完时调用，见 SPMAnalyzer.run_posthoc；命中缓存时只对尚未算出的组对调用。
+    lazy=True 时 posthoc_results 为 LazyPosthocResults，summary 只含已算出的组对；
+    按需计算与全部算完的结果共用同一缓存项，lazy=False 命中按需结果时补算其余组对。
+    params 为主效应分析的参数，据此复用已运行分析的会话（见 analysis_session），
+    不再重新堆叠数据和计算 ANOVA；各组对的置换次数固定为 posthoc_iterations。
+    """
+    key = posthoc_key(data, method, alpha, seed, correction) if cache is not None else None
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        posthoc_results, spm_result = cached
+        if not lazy and isinstance(posthoc_results, LazyPosthocResults):
+            posthoc_results.compute_remaining(on_pair)
+        return summarize_posthoc(posthoc_results), posthoc_results, spm_result
+
+    if params is None or params.get('test_type') != 'anova1':
+        params = {'test_type': 'anova1'}
+    analyzer = analysis_session(cache, data, params, method, seed)
+    spm_result = analyzer.spm_result
+
+    posthoc_results, ph_error = analyzer.run_posthoc(alpha=alpha, on_pair=on_pair,
+                                                     correction=correction, lazy=lazy,
+                                                     iterations=DEFAULT_SETTINGS['posthoc_iterations'])
+    if ph_error:
+        raise Exception(ph_error)
+
+    # 会话可能同时用于其他 α 的事后检验，汇总直接由本次结果得到
+    summary = summarize_posthoc(posthoc_results)
+    if cache is not None:
+        cache.put(key, (posthoc_results, spm_result))
+    return summary, posthoc_results, spm_result
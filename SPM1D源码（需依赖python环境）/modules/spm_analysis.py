@@ -1,5 +1,290 @@
+import os
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import numpy as np
 import spm1d
+from scipy import stats
+from spm1d.stats import _reml
+from spm1d.stats._spm import SPM_T
+from spm1d.stats.nonparam.factors import Factor
+from modules.dataset import GroupedData
+from modules.normality_test import inference_at_threshold
+from modules.permutation import install_batched_permuter, shared_posthoc_null, install_shared_null
+from utils.config import DEFAULT_SETTINGS
+
+EPS = np.finfo(float).eps
+
+def _as_float64(Y):
+    """以 float32 保存的数据在送入 spm1d 前临时升为 float64；float64 数据不复制"""
+    return np.asarray(Y, dtype=np.float64)
+
+def _stack_groups(data, group_names):
+    if isinstance(data, GroupedData) and data.matrix is not None and list(data) == list(group_names):
+        # 已合并存放的指标直接使用其矩阵，float64 存储时不复制
+        return _as_float64(data.matrix), data.labels
+    Y = np.concatenate([data[g] for g in group_names], axis=0, dtype=np.float64)
+    A = np.concatenate([np.full(data[g].shape[0], i)
+                        for i, g in enumerate(group_names)])
+    return Y, A
+
+def _split_groups(Y, A, n_groups):
+    """按组别标签把合并设计矩阵切成各组的行视图（各组行须连续）"""
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(A, minlength=n_groups))])
+    return [Y[bounds[i]:bounds[i + 1]] for i in range(n_groups)]
+
+def _remove_zero_variance_columns_pair(Ya, Yb):
+    """删除两组比较中方差为0的列"""
+    zero_cols_a = np.where(np.var(Ya, axis=0) == 0)[0]
+    zero_cols_b = np.where(np.var(Yb, axis=0) == 0)[0]
+    zero_cols = np.union1d(zero_cols_a, zero_cols_b)
+    if len(zero_cols) > 0:
+        Ya = np.delete(Ya, zero_cols, axis=1)
+        Yb = np.delete(Yb, zero_cols, axis=1)
+    return Ya, Yb
+
+def _posthoc_pair(Ya, Yb, method, alpha_corrected, iterations, seed, stream, workers=None):
+    """单个组对的两样本t检验与推断，返回 (spm_result, inference_result)，可在子进程中运行"""
+    Ya, Yb = _remove_zero_variance_columns_pair(_as_float64(Ya), _as_float64(Yb))
+
+    if method == 'param':
+        ttest_result = spm1d.stats.ttest2(Ya, Yb, equal_var=False)
+    else:
+        ttest_result = spm1d.stats.nonparam.ttest2(Ya, Yb)
+        batched = install_batched_permuter(ttest_result, seed=seed, stream=stream, workers=workers)
+        if seed is not None and not batched:
+            np.random.seed(seed)
+
+    try:
+        if method == 'param':
+            ttest_inference = ttest_result.inference(
+                alpha=alpha_corrected,
+                two_tailed=True
+            )
+        else:
+            ttest_inference = ttest_result.inference(
+                alpha=alpha_corrected,
+                two_tailed=True,
+                iterations=iterations
+            )
+    except Exception as e:
+        ttest_inference = None
+
+    mgr = getattr(ttest_result, 'mgr', None)
+    if mgr is not None:
+        # 去掉分块置换替换到实例上的方法，结果才能在进程间传递
+        for name in ('permute', 'build_secondary_pdf', 'seeded_fields'):
+            mgr.__dict__.pop(name, None)
+    return ttest_result, ttest_inference
+
+def _ttest2_reml_df(Ya, Yb, ss, X):
+    """两组方差不等时 ReML 估计的有效自由度，与 spm1d 的 _reml.estimate_df_T 相同"""
+    J, Ja = X.shape[0], Ya.shape[0]
+    q = np.sqrt((J - 2) / ss)
+    Ym = np.vstack([Ya * q, Yb * q])
+    YY = Ym @ Ym.T / Ya.shape[1]
+    Q0, Q1 = np.zeros((J, J)), np.zeros((J, J))
+    Q0[:Ja, :Ja] = np.eye(Ja)
+    Q1[Ja:, Ja:] = np.eye(J - Ja)
+    V, h = _reml.reml(YY, X, [Q0, Q1])
+    V = V * (J / np.trace(V))
+    trRV, trRVRV = _reml.traceRV(V, X)
+    return trRV ** 2 / trRVRV
+
+def _group_statistics(Y):
+    """一组数据的均值、残差平方和与残差梯度平方和"""
+    m = Y.mean(axis=0)
+    R = Y - m
+    dx = np.gradient(R, axis=1)
+    return m, (R * R).sum(axis=0), (dx * dx).sum(axis=0)
+
+def _pairwise_ttest2(Ys, pairs, group_stats=None):
+    """全部组对的参数两样本t检验，结果与 spm1d.stats.ttest2(equal_var=False) 相同
+
+    每组的均值、残差平方和与残差梯度平方和只算一次（或由 group_stats 给出），各组对
+    的 t 场、方差与平滑度 (FWHM) 由组统计量直接组合，不再逐对复制数据；只有 ReML
+    自由度需逐对估计。含方差为 0 的时间点的组对不在返回结果中。返回 {(i, j): SPM_T}。
+    """
+    if group_stats is None:
+        group_stats = [_group_statistics(Y) for Y in Ys]
+
+    spms = {}
+    for i, j in pairs:
+        (ma, ssa, ga), (mb, ssb, gb) = group_stats[i], group_stats[j]
+        if np.any(ssa == 0) or np.any(ssb == 0):
+            continue
+        Ja, Jb = Ys[i].shape[0], Ys[j].shape[0]
+        ss = ssa + ssb
+        sigma2 = ss / (Ja + Jb - 2)
+        z = (ma - mb) / np.sqrt(sigma2 * (1.0 / Ja + 1.0 / Jb) + EPS)
+
+        # 与 rft1d.geom.estimate_fwhm 相同：梯度法估计每个节点的粗糙度
+        v = (ga + gb) / (ss + EPS)
+        fwhm = 1 / np.sqrt(v[~np.isnan(v)] / (4 * np.log(2))).mean()
+        resels = (1, float(z.size - 1) / fwhm)
+
+        X = np.zeros((Ja + Jb, 2))
+        X[:Ja, 0] = 1
+        X[Ja:, 1] = 1
+        df = _ttest2_reml_df(Ys[i], Ys[j], ss, X)
+        spms[(i, j)] = SPM_T(z, (1, df), fwhm, resels, X, np.vstack([ma, mb]), sigma2=sigma2)
+    return spms
+
+def _rft_p_t(u, v, resels, n_nodes):
+    """t 场最大值超过 u 的 RFT 概率（含 Bonferroni 与 0D 校正），对 u、v、resels 逐元素计算"""
+    sf = stats.t.sf(u, v)
+    ec0 = np.maximum(sf, EPS)
+    ec1 = np.maximum((4 * np.log(2)) ** 0.5 / (2 * np.pi) * (1 + u ** 2 / v) ** ((1 - v) / 2), EPS)
+    expected = resels[:, 0] * ec0 + resels[:, 1] * ec1
+    p = 1 - np.exp(-(expected + EPS))
+    p = np.minimum(p, np.minimum(n_nodes * sf, 1))
+    return np.maximum(p, sf)
+
+def t_thresholds(spms, alpha=0.05, two_tailed=True):
+    """批量求 t 场的 RFT 临界阈值
+
+    与 SPM_T.inference 中逐个调用 rft1d.t.isf_resels 的结果一致，但对所有组对
+    同时做二分求根，取代逐个场的 Nelder-Mead 优化。返回 {键: zstar}。
+    """
+    keys = list(spms)
+    if not keys:
+        return {}
+    a = 0.5 * alpha if two_tailed else alpha
+    v = np.array([spms[key].df[1] for key in keys], dtype=float)
+    resels = np.array([spms[key].resels for key in keys], dtype=float)
+    resels[resels[:, 1] == 0, 1] = EPS
+    n_nodes = np.array([spms[key].Q for key in keys], dtype=float)
+
+    # P(u) 介于 0D 概率与 Bonferroni 上界之间，由此确定求根区间
+    lo = stats.t.isf(a, v)
+    hi = stats.t.isf(a / np.maximum(n_nodes, 1), v) + 1e-9
+    for _ in range(100):
+        mid = 0.5 * (lo + hi)
+        above = _rft_p_t(mid, v, resels, n_nodes) > a
+        lo = np.where(above, mid, lo)
+        hi = np.where(above, hi, mid)
+        if np.all(hi - lo < 1e-12):
+            break
+    zstar = 0.5 * (lo + hi)
+    return {key: float(z) for key, z in zip(keys, zstar)}
+
+def _param_posthoc(Ys, pairs, alpha_corrected, group_stats=None):
+    """参数事后检验：批量得到各组对的 t 场与临界阈值后逐对推断
+
+    返回 {(i, j): (spm_result, inference_result)}；含方差为 0 时间点的组对不在结果中。
+    """
+    spms = _pairwise_ttest2(Ys, pairs, group_stats)
+    thresholds = t_thresholds(spms, alpha_corrected)
+    outcomes = {}
+    for pair, ttest_result in spms.items():
+        try:
+            ttest_inference = inference_at_threshold(ttest_result, thresholds[pair],
+                                                     alpha=alpha_corrected, two_tailed=True)
+        except Exception as e:
+            ttest_inference = None
+        outcomes[pair] = (ttest_result, ttest_inference)
+    return outcomes
+
+def posthoc_pair_summary(results):
+    """单个组对事后检验结果的汇总"""
+    inference = results.get('inference_result')
+    if inference is None:
+        return {
+            'significant': None,
+            'alpha_corrected': results['alpha_corrected'],
+            'correction': results.get('correction', 'bonferroni'),
+            'zstar': None,
+            'p_values': [],
+            'n_clusters': 0
+        }
+
+    h0reject = inference.h0reject if hasattr(inference, 'h0reject') else False
+    zstar = inference.zstar if hasattr(inference, 'zstar') else None
+    p_values = inference.p if hasattr(inference, 'p') else None
+    n_clusters = inference.nClusters if hasattr(inference, 'nClusters') else 0
+
+    p_values_str = []
+    if p_values is not None:
+        if not isinstance(p_values, (list, np.ndarray)):
+            p_values = [p_values]
+        for p in p_values:
+            if p < 0.001:
+                p_values_str.append("<0.001")
+            else:
+                p_values_str.append(f"{p:.4f}")
+
+    return {
+        'significant': h0reject,
+        'alpha_corrected': results['alpha_corrected'],
+        'correction': results.get('correction', 'bonferroni'),
+        'zstar': zstar,
+        'p_values': p_values_str,
+        'n_clusters': n_clusters
+    }
+
+class LazyPosthocResults(Mapping):
+    """按需计算的事后检验结果：{组对名: 结果}
+
+    组对名在创建时即全部给出，某个组对首次被读取时才调用 compute 计算并保存。
+    compute_remaining 依次算完其余组对，可在后台线程中运行；读取与计算加锁，
+    已算出的组对读取时不等待。
+    """
+
+    def __init__(self, names, pairs, compute):
+        self._names = list(names)
+        self._pairs = dict(zip(self._names, pairs))
+        self._compute = compute
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        if name in self._results:
+            return self._results[name]
+        if name not in self._pairs:
+            raise KeyError(name)
+        with self._lock:
+            if name not in self._results:
+                self._results[name] = self._compute(self._pairs[name])
+            return self._results[name]
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._pairs
+
+    def is_computed(self, name):
+        return name in self._results
+
+    def computed(self):
+        """已算出的组对，按组对顺序"""
+        return {name: self._results[name] for name in self._names if name in self._results}
+
+    def compute_remaining(self, on_pair=None, cancelled=None):
+        """计算其余组对，on_pair(组对名, 结果) 在每个新算出的组对后调用
+
+        cancelled() 返回 True 时停止，返回是否已全部算完。
+        """
+        for name in self._names:
+            if cancelled is not None and cancelled():
+                return False
+            if name in self._results:
+                continue
+            results = self[name]
+            if on_pair is not None:
+                on_pair(name, results)
+        return True
+
+def summarize_posthoc(posthoc_results):
+    """各组对结果的汇总；按需计算的结果只汇总已算出的组对"""
+    if isinstance(posthoc_results, LazyPosthocResults):
+        posthoc_results = posthoc_results.computed()
+    return {pair_name: posthoc_pair_summary(results)
+            for pair_name, results in posthoc_results.items()}
 
 class SPMAnalyzer:
     def __init__(self, data, test_type='ttest2', method='param', **kwargs):
@@ -7,10 +292,35 @@ class SPMAnalyzer:
         self.test_type = test_type
         self.method = method
         self.kwargs = kwargs
+        self.seed = kwargs.get('seed')
+        self._batched = False
+        self.exact_permutations = False
+        self.monte_carlo = None
         self.spm_result = None
         self.inference_result = None
         self.posthoc_results = None
+        self._design = None
+        self._group_stats = None
         
+    def design(self):
+        """合并各组的设计 (Y, A, 组名)，首次调用时堆叠，之后 ANOVA 与事后检验共用"""
+        if self._design is None:
+            group_names = list(self.data.keys())
+            Y, A = _stack_groups(self.data, group_names)
+            self._design = (Y, A, group_names)
+        return self._design
+
+    def groups(self):
+        """各组的 float64 数据，即合并设计矩阵按行切出的视图，不另复制"""
+        Y, A, group_names = self.design()
+        return _split_groups(Y, A, len(group_names))
+
+    def group_statistics(self):
+        """各组的均值、残差平方和与残差梯度平方和，参数事后检验的各组对共用"""
+        if self._group_stats is None:
+            self._group_stats = [_group_statistics(Y) for Y in self.groups()]
+        return self._group_stats
+
     def run_analysis(self):
         if self.method == 'param':
             return self._run_parametric()
@@ -23,16 +333,16 @@ class SPMAnalyzer:
                 if len(self.data) != 2:
                     return None, "独立样本t检验需要两组数据"
                 group_names = list(self.data.keys())
-                YA = self.data[group_names[0]]
-                YB = self.data[group_names[1]]
+                YA = _as_float64(self.data[group_names[0]])
+                YB = _as_float64(self.data[group_names[1]])
                 self.spm_result = spm1d.stats.ttest2(YA, YB, equal_var=False)
                 
             elif self.test_type == 'ttest_paired':
                 if len(self.data) != 2:
                     return None, "配对样本t检验需要两组数据"
                 group_names = list(self.data.keys())
-                YA = self.data[group_names[0]]
-                YB = self.data[group_names[1]]
+                YA = _as_float64(self.data[group_names[0]])
+                YB = _as_float64(self.data[group_names[1]])
                 self.spm_result = spm1d.stats.ttest_paired(YA, YB)
                 
             elif self.test_type == 'ttest':
@@ -40,13 +350,13 @@ class SPMAnalyzer:
                 mu = self.kwargs.get('mu_data', 0)
                 if Y is None:
                     return None, "单样本t检验需要提供y_data参数"
+                Y = _as_float64(Y)
+                if isinstance(mu, np.ndarray):
+                    mu = _as_float64(mu)
                 self.spm_result = spm1d.stats.ttest(Y, mu)
                 
             elif self.test_type == 'anova1':
-                group_names = list(self.data.keys())
-                Y = np.vstack([self.data[g] for g in group_names])
-                A = np.concatenate([np.full(self.data[g].shape[0], i) 
-                                   for i, g in enumerate(group_names)])
+                Y, A, _ = self.design()
                 self.spm_result = spm1d.stats.anova1(Y, A, equal_var=False)
                 
             elif self.test_type == 'anova2':
@@ -55,7 +365,7 @@ class SPMAnalyzer:
                 if A is None or B is None:
                     return None, "双因素ANOVA需要提供A和B分组信息"
                 group_name = list(self.data.keys())[0]
-                Y = self.data[group_name]
+                Y = _as_float64(self.data[group_name])
                 self.spm_result = spm1d.stats.anova2(Y, A, B, equal_var=True)
                 
             elif self.test_type == 'regress':
@@ -90,16 +400,16 @@ class SPMAnalyzer:
                 if len(self.data) != 2:
                     return None, "独立样本t检验需要两组数据"
                 group_names = list(self.data.keys())
-                YA = self.data[group_names[0]]
-                YB = self.data[group_names[1]]
+                YA = _as_float64(self.data[group_names[0]])
+                YB = _as_float64(self.data[group_names[1]])
                 self.spm_result = spm1d.stats.nonparam.ttest2(YA, YB)
                 
             elif self.test_type == 'ttest_paired':
                 if len(self.data) != 2:
                     return None, "配对样本t检验需要两组数据"
                 group_names = list(self.data.keys())
-                YA = self.data[group_names[0]]
-                YB = self.data[group_names[1]]
+                YA = _as_float64(self.data[group_names[0]])
+                YB = _as_float64(self.data[group_names[1]])
                 self.spm_result = spm1d.stats.nonparam.ttest_paired(YA, YB)
                 
             elif self.test_type == 'ttest':
@@ -107,13 +417,13 @@ class SPMAnalyzer:
                 mu = self.kwargs.get('mu_data', 0)
                 if Y is None:
                     return None, "单样本t检验需要提供y_data参数"
+                Y = _as_float64(Y)
+                if isinstance(mu, np.ndarray):
+                    mu = _as_float64(mu)
                 self.spm_result = spm1d.stats.nonparam.ttest(Y, mu)
                 
             elif self.test_type == 'anova1':
-                group_names = list(self.data.keys())
-                Y = np.vstack([self.data[g] for g in group_names])
-                A = np.concatenate([np.full(self.data[g].shape[0], i) 
-                                   for i, g in enumerate(group_names)])
+                Y, A, _ = self.design()
                 self.spm_result = spm1d.stats.nonparam.anova1(Y, A)
                 
             elif self.test_type == 'regress':
@@ -122,6 +432,8 @@ class SPMAnalyzer:
             else:
                 return None, f"不支持的分析类型: {self.test_type}"
             
+            self._batched = install_batched_permuter(self.spm_result, seed=self.seed,
+                                                     workers=DEFAULT_SETTINGS['permutation_workers'])
             return self.spm_result, None
             
         except Exception as e:
@@ -141,12 +453,157 @@ class SPMAnalyzer:
                                                                       two_tailed=two_tailed)
             else:
                 iterations = kwargs.get('iterations', 500)
-                self.inference_result = self.spm_result.inference(alpha=alpha,
-                                                                  iterations=iterations)
+                # 不同置换总数不超过请求的次数时精确枚举，得到精确 p 值
+                n_unique = getattr(self.spm_result, 'nPermUnique', None)
+                self.exact_permutations = bool(n_unique) and 0 < n_unique <= iterations
+                if self.exact_permutations:
+                    iterations = -1
+                if self.seed is not None and not self._batched:
+                    np.random.seed(self.seed)
+                precision = kwargs.get('precision', DEFAULT_SETTINGS['adaptive_precision'])
+                seeded = getattr(self.spm_result.mgr, 'seeded_fields', None)
+                if kwargs.get('adaptive') and seeded is not None and not self.exact_permutations:
+                    self.inference_result = self._adaptive_inference(alpha, iterations, precision)
+                else:
+                    self.inference_result = self.spm_result.inference(alpha=alpha,
+                                                                      iterations=iterations)
+                    self.monte_carlo = (None if self.exact_permutations
+                                        else self._monte_carlo_precision(alpha, precision))
             return self.inference_result, None
         except Exception as e:
             return None, str(e)
 
+    def _adaptive_inference(self, alpha, max_iterations, precision):
+        """分批追加置换，临界阈值与各聚类 p 值达到所需蒙特卡洛精度后停止
+
+        每批置换由种子派生的随机数流按批序号生成，停止点与进程数无关；
+        首批至少 1/α 次，最多 max_iterations 次。
+        """
+        mgr = self.spm_result.mgr
+        batch = DEFAULT_SETTINGS['adaptive_batch']
+        target = min(max_iterations, max(batch, int(np.ceil(1 / alpha))))
+        blocks = []
+        n = 0
+        while True:
+            blocks.append(mgr.seeded_fields(target - n, block_size=batch,
+                                            first_block=int(np.ceil(n / batch))))
+            mgr.ZZ = np.vstack(blocks)
+            n = mgr.ZZ.shape[0]
+            inference_result, error = self.rethreshold(alpha, iterations=n, precision=precision)
+            if error:
+                raise ValueError(error)
+            if self.monte_carlo['settled'] or n >= max_iterations:
+                break
+            target = min(max_iterations, n + batch)
+
+        self.monte_carlo['stopped_early'] = n < max_iterations
+        return inference_result
+
+    def _monte_carlo_precision(self, alpha, precision):
+        """置换分布有限带来的蒙特卡洛误差
+
+        临界阈值取 1-α 分位数的 99% 次序统计量置信区间；p 值（含阈值对应的 α）
+        取 99% 正态近似置信半宽。观测最大统计量落在阈值区间之外、且每个聚类 p 值
+        的区间不含 α 或半宽不超过 precision 时视为已稳定。
+        """
+        mgr = self.spm_result.mgr
+        Z = np.sort(mgr.Z)
+        n = Z.size
+        z99 = 2.576
+        q = 1 - alpha
+        spread = z99 * np.sqrt(n * q * alpha)
+        lo = Z[int(np.clip(np.floor(n * q - spread), 0, n - 1))]
+        hi = Z[int(np.clip(np.ceil(n * q + spread), 0, n - 1))]
+
+        z = np.asarray(self.spm_result.z, dtype=np.float64)
+        zmax = np.nanmax(np.abs(z) if getattr(mgr, '_two_tailed', False) else z)
+        alpha_hw = z99 * np.sqrt(alpha * q / n)
+        settled = zmax < lo or zmax > hi or alpha_hw <= precision
+
+        p_hw = []
+        for p in np.atleast_1d(getattr(self.inference_result, 'p', [])):
+            pp = min(max(float(p), 1.0 / n), 1 - 1.0 / n)
+            hw = z99 * np.sqrt(pp * (1 - pp) / n)
+            p_hw.append(hw)
+            settled = settled and (hw <= precision or abs(float(p) - alpha) > hw)
+
+        return {
+            'zstar_ci': (float(lo), float(hi)),
+            'alpha_halfwidth': float(alpha_hw),
+            'p_halfwidth': float(max(p_hw)) if p_hw else None,
+            'precision': precision,
+            'settled': bool(settled),
+            'stopped_early': False,
+        }
+
+    def rethreshold(self, alpha, **kwargs):
+        """在已计算的统计场上按新的 α 重新推断
+
+        参数检验只需重新计算 RFT 阈值；非参数检验沿用上次推断得到的置换统计场
+        分布，只重新计算临界阈值、聚类及其 p 值，不重新置换。
+        """
+        if self.spm_result is None:
+            return None, "请先运行分析"
+        if self.method == 'param':
+            return self.inference(alpha=alpha, **kwargs)
+
+        mgr = getattr(self.spm_result, 'mgr', None)
+        if mgr is None or getattr(mgr, 'ZZ', None) is None:
+            return None, "请先运行一次推断以生成置换分布"
+
+        def reuse_permutations(niter=-1, two_tailed=False):
+            mgr._two_tailed = two_tailed
+
+        kwargs = dict(kwargs)
+        kwargs.pop('adaptive', None)
+        if not self.exact_permutations:
+            kwargs['iterations'] = mgr.ZZ.shape[0]
+
+        stopped_early = bool(self.monte_carlo and self.monte_carlo['stopped_early'])
+        permute = mgr.__dict__.get('permute')
+        mgr.permute = reuse_permutations
+        try:
+            result = self.inference(alpha=alpha, **kwargs)
+            if self.monte_carlo is not None:
+                self.monte_carlo['stopped_early'] = stopped_early
+            return result
+        finally:
+            if permute is None:
+                del mgr.permute
+            else:
+                mgr.permute = permute
+
+    def alpha_sweep(self, alphas, **kwargs):
+        """依次在多个 α 下重新推断，返回每个 α 的阈值、H0拒绝与聚类结果列表
+
+        某个 α 无法推断（如非参数检验的迭代次数不足）时该项只含 error。
+        不改变当前的推断结果、蒙特卡洛精度与置换管理器中按阈值得到的分布。
+        """
+        current = self.inference_result
+        monte_carlo = self.monte_carlo
+        mgr = getattr(self.spm_result, 'mgr', None)
+        saved = {name: getattr(mgr, name) for name in ('Z', 'Z2') if hasattr(mgr, name)}
+        rows = []
+        try:
+            for alpha in alphas:
+                inference_result, error = self.rethreshold(alpha, **kwargs)
+                if error:
+                    rows.append({'alpha': alpha, 'error': error.strip()})
+                    continue
+                rows.append({
+                    'alpha': alpha,
+                    'zstar': inference_result.zstar,
+                    'h0reject': inference_result.h0reject,
+                    'n_clusters': inference_result.nClusters,
+                    'p_cluster': inference_result.p,
+                })
+        finally:
+            self.inference_result = current
+            self.monte_carlo = monte_carlo
+            for name, value in saved.items():
+                setattr(mgr, name, value)
+        return rows, None
+
     def get_results_summary(self):
         if self.inference_result is None:
             return None
@@ -175,13 +632,28 @@ class SPMAnalyzer:
         if hasattr(self.spm_result, 'beta'):
             summary['beta'] = self.spm_result.beta
 
+        mgr = getattr(self.spm_result, 'mgr', None)
+        if self.method != 'param' and getattr(mgr, 'ZZ', None) is not None:
+            summary['n_permutations'] = mgr.ZZ.shape[0]
+            summary['exact_permutations'] = self.exact_permutations
+            summary['monte_carlo'] = self.monte_carlo
+
         summary['clusters'] = []
         summary['posthoc_results'] = self.posthoc_results
 
         return summary
 
-    def run_posthoc(self, alpha=0.05):
-        """ANOVA事后检验：组间两两比较，使用Bonferroni校正"""
+    def run_posthoc(self, alpha=0.05, on_pair=None, correction='bonferroni', lazy=False, iterations=None):
+        """ANOVA事后检验：组间两两比较，使用Bonferroni校正
+
+        参数检验由 _pairwise_ttest2 一次得到全部组对的 t 场；非参数检验时各组对分给
+        进程池并行计算，每对使用由随机种子与组对序号派生的随机数流，结果与进程数及
+        完成顺序无关。on_pair(组对名, 结果) 在每对完成时调用。
+        correction='maxt' 时改用全部组对共享置换的最大统计量校正，见 _run_posthoc_maxt。
+        lazy=True 时返回 LazyPosthocResults，组对在首次读取时才计算，结果与全部算完相同。
+        各组数据与组统计量取自本分析的合并设计（见 design），不重新堆叠；
+        iterations 为各组对的置换次数，默认与主效应分析相同。
+        """
         if self.test_type != 'anova1':
             return None, "事后检验仅适用于单因素ANOVA"
 
@@ -191,103 +663,138 @@ class SPMAnalyzer:
         if n_groups < 2:
             return None, "至少需要两组数据才能进行事后检验"
 
+        if correction == 'maxt':
+            if self.method == 'param':
+                return None, "置换最大统计量校正仅适用于非参数检验"
+            return self._run_posthoc_maxt(alpha, group_names, on_pair, lazy, iterations)
+
         n_comparisons = n_groups * (n_groups - 1) // 2
 
         alpha_corrected = spm1d.util.p_critical_bonf(alpha, n_comparisons)
 
-        self.posthoc_results = {}
+        if iterations is None:
+            iterations = self.kwargs.get('iterations', 1000)
+        pairs = [(i, j) for i in range(n_groups) for j in range(i + 1, n_groups)]
+        names = [f"{group_names[i]} vs {group_names[j]}" for i, j in pairs]
+        Ys = self.groups()
+        tasks = {(i, j): (Ys[i], Ys[j], self.method, alpha_corrected, iterations, self.seed, (i, j))
+                 for i, j in pairs}
 
-        iterations = self.kwargs.get('iterations', 1000)
+        def entry(outcome):
+            ttest_result, ttest_inference = outcome
+            return {
+                'spm_result': ttest_result,
+                'inference_result': ttest_inference,
+                'alpha_corrected': alpha_corrected,
+                'n_comparisons': n_comparisons,
+                'correction': 'bonferroni'
+            }
 
-        for i in range(n_groups):
-            for j in range(i + 1, n_groups):
-                pair_name = f"{group_names[i]} vs {group_names[j]}"
-                Ya = self.data[group_names[i]].copy()
-                Yb = self.data[group_names[j]].copy()
+        if lazy:
+            def compute(pair):
+                if self.method == 'param':
+                    i, j = pair
+                    group_stats = self.group_statistics()
+                    outcome = _param_posthoc([Ys[i], Ys[j]], [(0, 1)], alpha_corrected,
+                                             [group_stats[i], group_stats[j]]).get((0, 1))
+                    if outcome is not None:
+                        return entry(outcome)
+                return entry(_posthoc_pair(*tasks[pair], DEFAULT_SETTINGS['permutation_workers']))
 
-                Ya, Yb = self._remove_zero_variance_columns_pair(Ya, Yb)
+            self.posthoc_results = LazyPosthocResults(names, pairs, compute)
+            return self.posthoc_results, None
 
-                if self.method == 'param':
-                    ttest_result = spm1d.stats.ttest2(Ya, Yb, equal_var=False)
-                else:
-                    ttest_result = spm1d.stats.nonparam.ttest2(Ya, Yb)
+        results = {}
 
-                try:
-                    if self.method == 'param':
-                        ttest_inference = ttest_result.inference(
-                            alpha=alpha_corrected,
-                            two_tailed=True
-                        )
-                    else:
-                        ttest_inference = ttest_result.inference(
-                            alpha=alpha_corrected,
-                            two_tailed=True,
-                            iterations=iterations
-                        )
-                except Exception as e:
-                    ttest_inference = None
+        def finish(pair, outcome):
+            results[pair] = entry(outcome)
+            if on_pair is not None:
+                on_pair(f"{group_names[pair[0]]} vs {group_names[pair[1]]}", results[pair])
 
-                self.posthoc_results[pair_name] = {
-                    'spm_result': ttest_result,
-                    'inference_result': ttest_inference,
-                    'alpha_corrected': alpha_corrected,
-                    'n_comparisons': n_comparisons
-                }
+        if self.method == 'param':
+            outcomes = _param_posthoc(Ys, pairs, alpha_corrected, self.group_statistics())
+            for pair, outcome in outcomes.items():
+                finish(pair, outcome)
 
+        workers = DEFAULT_SETTINGS['permutation_workers'] or os.cpu_count() or 1
+        if self.method != 'param' and self.seed is not None and workers > 1 and len(pairs) > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=min(workers, len(pairs))) as pool:
+                    futures = {pool.submit(_posthoc_pair, *tasks[pair], 1): pair for pair in pairs}
+                    for future in as_completed(futures):
+                        finish(futures[future], future.result())
+            except (BrokenProcessPool, OSError):
+                # 无法启动子进程时余下的组对在当前进程内计算，结果相同
+                pass
+
+        for pair in pairs:
+            if pair not in results:
+                finish(pair, _posthoc_pair(*tasks[pair], DEFAULT_SETTINGS['permutation_workers']))
+
+        self.posthoc_results = {name: results[pair] for name, pair in zip(names, pairs)}
         return self.posthoc_results, None
 
-    def _remove_zero_variance_columns_pair(self, Ya, Yb):
-        """删除两组比较中方差为0的列"""
-        zero_cols_a = np.where(np.var(Ya, axis=0) == 0)[0]
-        zero_cols_b = np.where(np.var(Yb, axis=0) == 0)[0]
-        zero_cols = np.union1d(zero_cols_a, zero_cols_b)
-        if len(zero_cols) > 0:
-            Ya = np.delete(Ya, zero_cols, axis=1)
-            Yb = np.delete(Yb, zero_cols, axis=1)
-        return Ya, Yb
+    def _run_posthoc_maxt(self, alpha, group_names, on_pair=None, lazy=False, iterations=None):
+        """非参数事后检验（最大统计量法）：全部组对共用一套合并组别的置换
+
+        每个置换由各组的和与平方和一次得到全部组对的 t 场，以各组对 |t| 的最大值
+        构成零分布，所有组对使用同一临界阈值，在 α 水平上控制整体 I 类错误，
+        不再做 Bonferroni 校正。任一组方差为 0 的时间点在全部组对中删除。
+        lazy=True 时零分布在第一个组对被读取时计算，之后各组对只做推断。
+        """
+        n_groups = len(group_names)
+        n_comparisons = n_groups * (n_groups - 1) // 2
+        pairs = [(i, j) for i in range(n_groups) for j in range(i + 1, n_groups)]
+        names = [f"{group_names[i]} vs {group_names[j]}" for i, j in pairs]
+
+        Y, A, _ = self.design()
+        zero_cols = np.flatnonzero(np.any([np.var(Yg, axis=0) == 0 for Yg in self.groups()], axis=0))
+        if zero_cols.size > 0:
+            Y = np.delete(Y, zero_cols, axis=1)
+        Ys = _split_groups(Y, A, n_groups)
+
+        if iterations is None:
+            iterations = self.kwargs.get('iterations', 1000)
+        null = []
+
+        def compute(pair):
+            if not null:
+                null.extend(shared_posthoc_null(Y, A, pairs, iterations, self.seed))
+                null.append(Factor(A).ncomb)
+            ZZ, secondary, n_perm, n_unique = null
+
+            i, j = pair
+            ttest_result = spm1d.stats.nonparam.ttest2(Ys[i], Ys[j])
+            ttest_result.nPermUnique = n_unique
+            install_shared_null(ttest_result, ZZ, secondary)
+            try:
+                ttest_inference = ttest_result.inference(alpha=alpha, two_tailed=True, iterations=n_perm)
+            except Exception as e:
+                ttest_inference = None
+
+            return {
+                'spm_result': ttest_result,
+                'inference_result': ttest_inference,
+                'alpha_corrected': alpha,
+                'n_comparisons': n_comparisons,
+                'correction': 'maxt'
+            }
+
+        if lazy:
+            self.posthoc_results = LazyPosthocResults(names, pairs, compute)
+            return self.posthoc_results, None
+
+        self.posthoc_results = {}
+        for pair_name, pair in zip(names, pairs):
+            self.posthoc_results[pair_name] = compute(pair)
+            if on_pair is not None:
+                on_pair(pair_name, self.posthoc_results[pair_name])
+
+        return self.posthoc_results, None
 
     def get_posthoc_summary(self):
         """获取事后检验汇总"""
         if self.posthoc_results is None:
             return None
 
-        summary = {}
-        for pair_name, results in self.posthoc_results.items():
-            inference = results.get('inference_result')
-            if inference is not None:
-                h0reject = inference.h0reject if hasattr(inference, 'h0reject') else False
-                zstar = inference.zstar if hasattr(inference, 'zstar') else None
-                p_values = inference.p if hasattr(inference, 'p') else None
-                n_clusters = inference.nClusters if hasattr(inference, 'nClusters') else 0
-
-                p_values_str = []
-                if p_values is not None:
-                    if isinstance(p_values, (list, np.ndarray)):
-                        for p in p_values:
-                            if p < 0.001:
-                                p_values_str.append("<0.001")
-                            else:
-                                p_values_str.append(f"{p:.4f}")
-                    else:
-                        if p_values < 0.001:
-                            p_values_str.append("<0.001")
-                        else:
-                            p_values_str.append(f"{p_values:.4f}")
-
-                summary[pair_name] = {
-                    'significant': h0reject,
-                    'alpha_corrected': results['alpha_corrected'],
-                    'zstar': zstar,
-                    'p_values': p_values_str,
-                    'n_clusters': n_clusters
-                }
-            else:
-                summary[pair_name] = {
-                    'significant': None,
-                    'alpha_corrected': results['alpha_corrected'],
-                    'zstar': None,
-                    'p_values': [],
-                    'n_clusters': 0
-                }
-
-        return summary
+        return summarize_posthoc(self.posthoc_results)
@@ -50,7 +50,7 @@ class TabAbout(QWidget):
             "    - t 检验（独立样本t检验、配对样本t检验、单样本t检验）\n"
             "    - ANOVA（单因素方差分析）\n"
             "    - 简单回归（单指标）\n"
-            "• 事后检验：采用Bonferroni 校正进行组间两两比较\n"
+            "• 事后检验：采用Bonferroni 校正或置换最大统计量法（非参数）进行组间两两比较\n"
             "• 结果可视化：均值曲线、SPM曲线、K²曲线、事后检验图等\n"
             "• 数据导出：.xlsx 格式，包含全部原始数据"
         )
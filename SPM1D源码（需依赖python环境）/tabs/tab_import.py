@@ -2,20 +2,32 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                               QPushButton, QFileDialog, QTableWidget,
                               QTableWidgetItem, QGroupBox, QRadioButton,
                               QButtonGroup, QLineEdit, QProgressBar,
-                              QMessageBox, QHeaderView, QMessageBox)
-from PyQt5.QtCore import Qt
+                              QMessageBox, QHeaderView, QMessageBox,
+                              QCheckBox, QSpinBox)
+from PyQt5.QtCore import Qt, QFileSystemWatcher, QTimer
 from PyQt5.QtGui import QFont
 import os
 import pandas as pd
 import numpy as np
-from modules.data_loader import load_data_by_indicator
+from modules.data_loader import (get_group_shapes, validate_data_structure,
+                                 prescan_data_structure, format_timepoint_mismatch,
+                                 list_indicator_folders)
+from modules.data_cache import get_default_cache
+from modules.dataset import LazyDataset
+from utils.config import DEFAULT_SETTINGS
 
 class TabImport(QWidget):
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
         self.data = None
+        self.load_report = []
         self.indicator_layout = None  # 添加这个
+        self.watcher = None
+        self.reload_timer = QTimer(self)
+        self.reload_timer.setSingleShot(True)
+        self.reload_timer.setInterval(500)
+        self.reload_timer.timeout.connect(lambda: self.reload_changed(quiet=True))
         self.setup_ui()
 
     def setup_ui(self):
@@ -27,6 +39,7 @@ class TabImport(QWidget):
         layout.addWidget(title)
 
         layout.addLayout(self._create_select_section())
+        layout.addLayout(self._create_resample_section())
         layout.addLayout(self._create_indicator_section())
         layout.addLayout(self._create_preview_section())
         layout.addLayout(self._create_button_section())
@@ -47,18 +60,61 @@ class TabImport(QWidget):
         btn_browse = QPushButton("浏览...")
         btn_browse.clicked.connect(self.browse_folder)
 
+        btn_prescan = QPushButton("预检结构")
+        btn_prescan.setToolTip("只读取文件表头，检查各组别时间点数是否一致")
+        btn_prescan.clicked.connect(self.prescan_data)
+
         btn_load = QPushButton("加载数据")
         btn_load.clicked.connect(self.load_data)
 
+        btn_reload = QPushButton("增量刷新")
+        btn_reload.setToolTip("只重新读取新增或修改过的文件")
+        btn_reload.clicked.connect(lambda: self.reload_changed())
+
+        self.watch_check = QCheckBox("监视文件夹")
+        self.watch_check.setToolTip("文件变化时自动增量刷新")
+        self.watch_check.toggled.connect(self.update_watcher)
+
         group_layout.addWidget(self.root_path)
         group_layout.addWidget(btn_browse)
+        group_layout.addWidget(btn_prescan)
         group_layout.addWidget(btn_load)
+        group_layout.addWidget(btn_reload)
+        group_layout.addWidget(self.watch_check)
 
         group.setLayout(group_layout)
         layout.addWidget(group)
 
         return layout
 
+    def _create_resample_section(self):
+        layout = QHBoxLayout()
+
+        group = QGroupBox("时间标准化")
+        group_layout = QHBoxLayout()
+
+        resample_nodes = DEFAULT_SETTINGS.get('resample_nodes')
+        self.resample_check = QCheckBox("加载时将每次试验重采样为")
+        self.resample_check.setToolTip("试验长度不同（较短的行以空值补齐）或各组时间点数不一致时使用")
+        self.resample_check.setChecked(bool(resample_nodes))
+
+        self.resample_nodes_input = QSpinBox()
+        self.resample_nodes_input.setRange(2, 10001)
+        self.resample_nodes_input.setValue(resample_nodes or 101)
+
+        group_layout.addWidget(self.resample_check)
+        group_layout.addWidget(self.resample_nodes_input)
+        group_layout.addWidget(QLabel("个节点"))
+        group_layout.addStretch()
+
+        group.setLayout(group_layout)
+        layout.addWidget(group)
+
+        return layout
+
+    def get_resample_nodes(self):
+        return self.resample_nodes_input.value() if self.resample_check.isChecked() else None
+
     def _create_indicator_section(self):
         layout = QHBoxLayout()
 
@@ -116,6 +172,55 @@ class TabImport(QWidget):
         if folder:
             self.root_path.setText(folder)
 
+    def prescan_data(self):
+        root_path = self.root_path.text()
+        if not root_path:
+            QMessageBox.warning(self, "警告", "请先选择根目录")
+            return
+
+        if not os.path.exists(root_path):
+            QMessageBox.warning(self, "警告", "目录不存在")
+            return
+
+        try:
+            result = prescan_data_structure(root_path)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"预检失败: {str(e)}")
+            return
+
+        resample_nodes = self.get_resample_nodes()
+        mismatches = {} if resample_nodes else result['mismatches']
+
+        self.preview_table.setRowCount(0)
+        for indicator_name, groups in result['shapes'].items():
+            mismatch = mismatches.get(indicator_name)
+            for group_name, shape in groups.items():
+                status = "表头一致"
+                if resample_nodes:
+                    status = f"将重采样为 {resample_nodes} 个节点"
+                elif mismatch is not None:
+                    status = f"⚠ 时间点数不一致 ({shape[1]})"
+                self._add_preview_row(group_name, shape[0], shape[1], indicator_name,
+                                      result['paths'][indicator_name][group_name], status)
+        for entry in result['errors']:
+            self._add_preview_row(entry['group'], "-", "-", entry['indicator'],
+                                  entry['path'], f"✗ {entry['error']}")
+
+        elapsed = f"{result['seconds'] * 1000:.0f} ms"
+        self.data_info.setText(f"预检 {len(result['shapes'])} 个指标，耗时 {elapsed}（未解析数据）")
+
+        if mismatches or result['errors']:
+            problems = [format_timepoint_mismatch(indicator_name, counts)
+                        for indicator_name, counts in mismatches.items()]
+            if result['errors']:
+                problems.append(f"{len(result['errors'])} 个文件无法读取:\n" +
+                                "\n".join(f"  - {os.path.basename(r['path'])}: {r['error']}"
+                                          for r in result['errors']))
+            msg = f"预检完成（耗时 {elapsed}），请修正以下问题后再加载数据:\n\n" + "\n".join(problems)
+            QMessageBox.warning(self, "结构不一致", msg)
+        else:
+            QMessageBox.information(self, "预检通过", f"所有指标的组别时间点数一致（耗时 {elapsed}）")
+
     def load_data(self):
         root_path = self.root_path.text()
         if not root_path:
@@ -127,7 +232,14 @@ class TabImport(QWidget):
             return
 
         try:
-            data = load_data_by_indicator(root_path)
+            data = LazyDataset(root_path,
+                               max_loaded=DEFAULT_SETTINGS['max_loaded_indicators'],
+                               max_workers=DEFAULT_SETTINGS['load_workers'],
+                               cache=get_default_cache(),
+                               resample_nodes=self.get_resample_nodes(),
+                               dtype=DEFAULT_SETTINGS['storage_dtype'])
+            report = data.scan_report
+            self.load_report = report
 
             if not data:
                 QMessageBox.warning(self, "警告", "未找到有效的指标文件夹")
@@ -135,16 +247,81 @@ class TabImport(QWidget):
 
             self.data = data
             self.update_indicator_list(data)
-            self.update_preview(data)
+            self.update_preview(data, report)
 
             self.main_window.analysis_data = data
             self.btn_next.setEnabled(True)
-
-            QMessageBox.information(self, "成功", "成功加载数据")
+            self.update_watcher()
+
+            failed = [r for r in report if r['error']]
+            valid, structure_msg = validate_data_structure(data)
+            if failed or not valid:
+                msg = "成功扫描数据"
+                if failed:
+                    msg += f"，{len(failed)} 个文件无法读取:\n"
+                    msg += "\n".join(f"  - {os.path.basename(r['path'])}: {r['error']}" for r in failed)
+                if not valid:
+                    msg += f"\n\n{structure_msg}"
+                QMessageBox.warning(self, "部分失败", msg)
+            else:
+                QMessageBox.information(self, "成功", "成功扫描数据，选择指标后加载")
 
         except Exception as e:
             QMessageBox.critical(self, "错误", f"加载失败: {str(e)}")
 
+    def reload_changed(self, quiet=False):
+        """增量刷新：只重新扫描、解析新增或修改过的文件，并作废受影响指标的下游结果"""
+        data = self.data
+        if not hasattr(data, 'refresh'):
+            if not quiet:
+                QMessageBox.warning(self, "警告", "请先加载数据")
+            return
+
+        try:
+            affected = data.refresh()
+        except Exception as e:
+            if not quiet:
+                QMessageBox.critical(self, "错误", f"刷新失败: {str(e)}")
+            return
+
+        self.load_report = data.scan_report
+        self.update_watcher()
+        if not affected:
+            if not quiet:
+                QMessageBox.information(self, "提示", "没有文件发生变化")
+            return
+
+        selected = self.main_window.selected_indicator
+        self.update_indicator_list(data)
+        for radio, indicator_name in zip(self.indicator_radios, data):
+            if indicator_name == selected:
+                radio.setChecked(True)
+        self.update_preview(data, self.load_report)
+
+        invalidated = self.main_window.invalidate_indicator_results(affected)
+        msg = f"已刷新指标: {', '.join(sorted(affected))}"
+        if invalidated:
+            msg += f"\n当前指标 {selected} 的检验与分析结果已失效，请重新运行"
+        if quiet:
+            self.main_window.statusBar().showMessage(msg.replace("\n", "；"))
+        else:
+            QMessageBox.information(self, "刷新完成", msg)
+
+    def update_watcher(self):
+        if self.watcher is not None:
+            self.watcher.deleteLater()
+            self.watcher = None
+        if not self.watch_check.isChecked() or not hasattr(self.data, 'tree'):
+            return
+
+        paths = {self.data.root_path}
+        paths.update(folder for _, folder in list_indicator_folders(self.data.root_path))
+        paths.update(self.data.snapshot)
+        self.watcher = QFileSystemWatcher(sorted(paths), self)
+        # 保存文件时常连续触发多次，合并为一次刷新
+        self.watcher.directoryChanged.connect(lambda _: self.reload_timer.start())
+        self.watcher.fileChanged.connect(lambda _: self.reload_timer.start())
+
     def update_indicator_list(self, data):
         # 清除现有的单选按钮（保留第一个标签）
         while self.indicator_layout.count() > 1:
@@ -154,40 +331,62 @@ class TabImport(QWidget):
 
         self.indicator_radios.clear()
 
-        for i, (indicator_name, groups) in enumerate(data.items()):
+        for i, (indicator_name, groups) in enumerate(get_group_shapes(data).items()):
             radio = QRadioButton(f"{indicator_name} ({len(groups)} 个组别)")
             radio.setChecked(i == 0)
             self.indicator_group.addButton(radio)
             self.indicator_radios.append(radio)
             self.indicator_layout.addWidget(radio)
 
-    def update_preview(self, data):
+    def update_preview(self, data, report=None):
         self.preview_table.setRowCount(0)
-
-        for indicator_name, groups in data.items():
-            for group_name, group_data in groups.items():
-                row = self.preview_table.rowCount()
-                self.preview_table.insertRow(row)
-
-                self.preview_table.setItem(row, 0, QTableWidgetItem(group_name))
-                self.preview_table.setItem(row, 1, QTableWidgetItem(str(group_data.shape[0])))
-                self.preview_table.setItem(row, 2, QTableWidgetItem(str(group_data.shape[1])))
-                self.preview_table.setItem(row, 3, QTableWidgetItem(indicator_name))
-                self.preview_table.setItem(row, 4, QTableWidgetItem("已加载"))
-                self.preview_table.setItem(row, 5, QTableWidgetItem("✓"))
-
-        total_samples = sum(sum(g.shape[0] for g in groups.values()) for groups in data.values())
-        
-        first_group_data = None
-        for groups in data.values():
-            for group_data in groups.values():
-                first_group_data = group_data
+        shapes = get_group_shapes(data)
+        timings = {(r['indicator'], name): r
+                   for r in getattr(data, 'load_report', [])
+                   for name in (r['groups'] or [r['group']])}
+
+        for indicator_name, groups in shapes.items():
+            for group_name, shape in groups.items():
+                entry = timings.get((indicator_name, group_name))
+                if hasattr(data, 'metadata'):
+                    path = data.metadata[indicator_name][group_name]['path']
+                else:
+                    path = "已加载"
+                if entry is not None and entry['error']:
+                    status = f"✗ {entry['error']}"
+                elif entry is not None:
+                    source = "缓存" if entry.get('cached') else "解析"
+                    status = f"✓ {source} {entry['seconds']:.2f}s"
+                elif hasattr(data, 'is_loaded') and not data.is_loaded(indicator_name):
+                    status = "未加载"
+                else:
+                    status = "✓"
+                self._add_preview_row(group_name, shape[0], shape[1], indicator_name, path, status)
+
+        for entry in (report or []):
+            if entry['error'] is None:
+                continue
+            self._add_preview_row(entry['group'], "-", "-", entry['indicator'],
+                                  entry['path'], f"✗ {entry['error']}")
+
+        total_samples = sum(sum(shape[0] for shape in groups.values()) for groups in shapes.values())
+
+        first_shape = None
+        for groups in shapes.values():
+            for shape in groups.values():
+                first_shape = shape
                 break
             break
-        
-        total_timepoints = first_group_data.shape[1] if first_group_data is not None else 0
 
-        self.data_info.setText(f"已加载 {len(data)} 个指标，共 {total_samples} 个样本，{total_timepoints} 个时间点")
+        total_timepoints = first_shape[1] if first_shape is not None else 0
+
+        self.data_info.setText(f"已识别 {len(shapes)} 个指标，共 {total_samples} 个样本，{total_timepoints} 个时间点")
+
+    def _add_preview_row(self, group_name, n_samples, n_timepoints, indicator_name, path, status):
+        row = self.preview_table.rowCount()
+        self.preview_table.insertRow(row)
+        for col, value in enumerate([group_name, n_samples, n_timepoints, indicator_name, path, status]):
+            self.preview_table.setItem(row, col, QTableWidgetItem(str(value)))
 
     def go_next(self):
         for i, radio in enumerate(self.indicator_radios):
@@ -195,4 +394,17 @@ class TabImport(QWidget):
                 self.main_window.selected_indicator = list(self.main_window.analysis_data.keys())[i]
                 break
 
+        indicator = self.main_window.selected_indicator
+        data = self.main_window.analysis_data
+        if indicator is not None and hasattr(data, 'is_loaded') and not data.is_loaded(indicator):
+            try:
+                groups = data[indicator]
+            except Exception as e:
+                QMessageBox.critical(self, "错误", f"加载指标 {indicator} 失败: {str(e)}")
+                return
+            if not groups:
+                QMessageBox.warning(self, "警告", f"指标 {indicator} 没有可用的组别数据")
+                return
+            self.update_preview(data, self.load_report)
+
         self.main_window.next_tab()
@@ -2,16 +2,87 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                               QPushButton, QTableWidget, QTableWidgetItem,
                               QGroupBox, QRadioButton, QButtonGroup,
                               QDoubleSpinBox, QMessageBox, QHeaderView,
-                              QTextEdit, QFileDialog)
-from PyQt5.QtCore import Qt
+                              QTextEdit, QFileDialog, QProgressBar, QComboBox)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont
-from modules.normality_test import run_normality_tests
+from modules.normality_test import (group_normality_entries, recommend_test_method,
+                                    residual_normality_test, RESIDUAL_GROUP_NAME)
+from utils.config import DEFAULT_SETTINGS
+
+NORMALITY_MODES = [
+    ("各组分别检验", None),
+    ("模型残差 - 独立样本t检验", 'ttest2'),
+    ("模型残差 - 配对样本t检验", 'ttest_paired'),
+    ("模型残差 - 单因素ANOVA", 'anova1'),
+]
+
+class NormalityThread(QThread):
+    group_finished = pyqtSignal(str, dict)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(dict)
+    cancelled = pyqtSignal()
+    error = pyqtSignal(str)
+
+    def __init__(self, main_window, data, alpha=0.05, residual_test_type=None):
+        super().__init__()
+        self.main_window = main_window
+        self.data = data
+        self.alpha = alpha
+        self.residual_test_type = residual_test_type
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        try:
+            indicator = getattr(self.main_window, 'selected_indicator', None)
+            if not indicator or indicator not in self.data:
+                indicator = next(iter(self.data))
+            test_data = self.data[indicator]
+
+            if self.residual_test_type:
+                # 模型残差只有一次检验，无法分批，进度条显示为忙碌状态
+                self.progress.emit(0, 0)
+                results = residual_normality_test(test_data, self.residual_test_type, self.alpha)
+                if self._cancelled:
+                    self.cancelled.emit()
+                    return
+                self.group_finished.emit(RESIDUAL_GROUP_NAME, results['groups'][RESIDUAL_GROUP_NAME])
+                self.progress.emit(1, 1)
+                self.finished.emit(results)
+                return
+
+            # 每批若干组别一起求阈值，批间更新表格与进度并响应取消
+            names = list(test_data)
+            block = max(1, DEFAULT_SETTINGS['normality_block_groups'])
+            results = {}
+            self.progress.emit(0, len(names))
+            for start in range(0, len(names), block):
+                if self._cancelled:
+                    self.cancelled.emit()
+                    return
+                chunk = {name: test_data[name] for name in names[start:start + block]}
+                for group_name, result in group_normality_entries(chunk, self.alpha).items():
+                    results[group_name] = result
+                    self.group_finished.emit(group_name, result)
+                self.progress.emit(len(results), len(names))
+
+            self.finished.emit({
+                'groups': results,
+                'recommendation': recommend_test_method(results, self.alpha),
+                'alpha': self.alpha
+            })
+
+        except Exception as e:
+            self.error.emit(str(e))
 
 class TabNormality(QWidget):
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
         self.results = None
+        self.normality_thread = None
         self.setup_ui()
 
     def setup_ui(self):
@@ -43,12 +114,24 @@ class TabNormality(QWidget):
         self.alpha_input.setDecimals(3)
         group_layout.addWidget(self.alpha_input)
 
+        group_layout.addWidget(QLabel("检验对象:"))
+        self.mode_combo = QComboBox()
+        for label, test_type in NORMALITY_MODES:
+            self.mode_combo.addItem(label, test_type)
+        self.mode_combo.setToolTip("模型残差：按所选检验设计计算残差后只做一次检验，与后续SPM分析的假设一致")
+        group_layout.addWidget(self.mode_combo)
+
         group_layout.addStretch()
 
-        btn_run = QPushButton("运行正态性检验")
-        btn_run.clicked.connect(self.run_test)
+        self.btn_run = QPushButton("运行正态性检验")
+        self.btn_run.clicked.connect(self.run_test)
+
+        self.btn_cancel = QPushButton("取消")
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self.cancel_test)
 
-        group_layout.addWidget(btn_run)
+        group_layout.addWidget(self.btn_run)
+        group_layout.addWidget(self.btn_cancel)
 
         group.setLayout(group_layout)
         layout.addWidget(group)
@@ -66,6 +149,11 @@ class TabNormality(QWidget):
         self.result_table.setHorizontalHeaderLabels(["组别", "平均K²统计量", "平均p值", "显著性", "状态"])
         self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
 
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("%v / %m 组")
+        self.progress_bar.setVisible(False)
+
+        group_layout.addWidget(self.progress_bar)
         group_layout.addWidget(self.result_table)
 
         group.setLayout(group_layout)
@@ -111,50 +199,101 @@ class TabNormality(QWidget):
             QMessageBox.warning(self, "警告", "请先加载数据")
             return
 
-        indicator = getattr(self.main_window, 'selected_indicator', None)
-        if indicator and indicator in data:
-            test_data = data[indicator]
-        else:
-            test_data = list(data.values())[0]
-
-        try:
-            alpha = self.alpha_input.value()
-            self.results = run_normality_tests(test_data, alpha)
-
-            self.update_results_table()
-            self.update_recommendation()
-
-            self.main_window.normality_results = self.results
+        # 运行中按钮不可用，这里只会遇到数据变化后已作废、尚未结束的检验
+        self.discard_test(wait=True)
 
-            QMessageBox.information(self, "完成", "正态性检验完成！")
-
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"检验失败: {str(e)}")
+        self.results = None
+        self.main_window.normality_results = None
+        self.result_table.setRowCount(0)
+        self.recommendation_text.clear()
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.btn_run.setEnabled(False)
+        self.btn_cancel.setEnabled(True)
+
+        self.normality_thread = NormalityThread(self.main_window, data, self.alpha_input.value(),
+                                                self.mode_combo.currentData())
+        self.normality_thread.group_finished.connect(self.add_result_row)
+        self.normality_thread.progress.connect(self.on_test_progress)
+        self.normality_thread.finished.connect(self.on_test_finished)
+        self.normality_thread.cancelled.connect(self.on_test_cancelled)
+        self.normality_thread.error.connect(self.on_test_error)
+        self.normality_thread.start()
+
+    def cancel_test(self):
+        if self.normality_thread is not None and self.normality_thread.isRunning():
+            self.normality_thread.cancel()
+            self.btn_cancel.setEnabled(False)
+
+    def discard_test(self, wait=False):
+        """停止正在进行的检验并断开其信号，之后到达的结果不再显示"""
+        if self.normality_thread is None or not self.normality_thread.isRunning():
+            return
+        self.normality_thread.cancel()
+        thread = self.normality_thread
+        for signal in (thread.group_finished, thread.progress, thread.finished,
+                       thread.cancelled, thread.error):
+            try:
+                signal.disconnect()
+            except TypeError:
+                # 已在前一次作废时断开
+                pass
+        self._reset_controls()
+        if wait:
+            thread.wait()
+
+    def on_test_progress(self, done, total):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(done)
+
+    def on_test_finished(self, results):
+        self._reset_controls()
+        self.results = results
+        self.update_recommendation()
+        self.main_window.normality_results = self.results
+
+        QMessageBox.information(self, "完成", "正态性检验完成！")
+
+    def on_test_cancelled(self):
+        self._reset_controls()
+        QMessageBox.information(self, "已取消", "正态性检验已取消，请重新运行")
+
+    def on_test_error(self, error):
+        self._reset_controls()
+        QMessageBox.critical(self, "错误", f"检验失败: {error}")
+
+    def _reset_controls(self):
+        self.progress_bar.setVisible(False)
+        self.btn_run.setEnabled(True)
+        self.btn_cancel.setEnabled(False)
 
     def update_results_table(self):
         self.result_table.setRowCount(0)
 
         for group_name, result in self.results['groups'].items():
-            row = self.result_table.rowCount()
-            self.result_table.insertRow(row)
+            self.add_result_row(group_name, result)
+
+    def add_result_row(self, group_name, result):
+        row = self.result_table.rowCount()
+        self.result_table.insertRow(row)
 
-            k2_val = result.get('k2_statistic', 'N/A')
-            p_val = result.get('p_value', 'N/A')
+        k2_val = result.get('k2_statistic', 'N/A')
+        p_val = result.get('p_value', 'N/A')
 
-            self.result_table.setItem(row, 0, QTableWidgetItem(group_name))
-            self.result_table.setItem(row, 1, QTableWidgetItem(f"{k2_val:.4f}" if isinstance(k2_val, float) else str(k2_val)))
-            self.result_table.setItem(row, 2, QTableWidgetItem(f"{p_val:.4f}" if isinstance(p_val, float) else str(p_val)))
+        self.result_table.setItem(row, 0, QTableWidgetItem(group_name))
+        self.result_table.setItem(row, 1, QTableWidgetItem(f"{k2_val:.4f}" if isinstance(k2_val, float) else str(k2_val)))
+        self.result_table.setItem(row, 2, QTableWidgetItem(f"{p_val:.4f}" if isinstance(p_val, float) else str(p_val)))
 
-            is_normal = result.get('is_normal', False)
-            status = "不显著" if is_normal else "显著"
-            significance = "✓ 正态" if is_normal else "✗ 非正态"
+        is_normal = result.get('is_normal', False)
+        status = "不显著" if is_normal else "显著"
+        significance = "✓ 正态" if is_normal else "✗ 非正态"
 
-            if 'error' in result:
-                status = "不支持"
-                significance = "✗ 不支持"
+        if 'error' in result:
+            status = "不支持"
+            significance = "✗ 不支持"
 
-            self.result_table.setItem(row, 3, QTableWidgetItem(status))
-            self.result_table.setItem(row, 4, QTableWidgetItem(significance))
+        self.result_table.setItem(row, 3, QTableWidgetItem(status))
+        self.result_table.setItem(row, 4, QTableWidgetItem(significance))
 
     def update_recommendation(self):
         rec = self.results['recommendation']
@@ -168,6 +307,10 @@ class TabNormality(QWidget):
         self.main_window.prev_tab()
 
     def go_next(self):
+        if self.normality_thread is not None and self.normality_thread.isRunning():
+            QMessageBox.warning(self, "警告", "正态性检验仍在运行，请稍候")
+            return
+
         if not self.results:
             QMessageBox.warning(self, "警告", "请先运行正态性检验")
             return
@@ -2,9 +2,11 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                               QPushButton, QGroupBox, QRadioButton,
                               QButtonGroup, QDoubleSpinBox, QSpinBox,
                               QMessageBox, QTextEdit, QDialog, QComboBox,
-                              QDialogButtonBox)
+                              QDialogButtonBox, QCheckBox)
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
+from modules.data_loader import get_group_shapes
+from utils.config import DEFAULT_SETTINGS
 
 class TabParams(QWidget):
     def __init__(self, main_window):
@@ -68,11 +70,14 @@ class TabParams(QWidget):
         if not self.main_window.analysis_data:
             return []
 
-        for indicator_key, groups in self.main_window.analysis_data.items():
-            n_groups = len(groups)
-            break
-        else:
+        # 只用组别清单决定可选检验，延迟加载的数据集不会因此解析任何指标
+        shapes = get_group_shapes(self.main_window.analysis_data)
+        if not shapes:
             return []
+        indicator = getattr(self.main_window, 'selected_indicator', None)
+        if indicator not in shapes:
+            indicator = next(iter(shapes))
+        n_groups = len(shapes[indicator])
 
         if n_groups == 2:
             return [
@@ -114,6 +119,20 @@ class TabParams(QWidget):
         self.iterations_input.setSingleStep(100)
         group_layout.addWidget(self.iterations_input)
 
+        self.adaptive_check = QCheckBox("自适应停止")
+        self.adaptive_check.setToolTip("分批置换，临界阈值与聚类p值达到所需精度后提前停止；置换次数作为上限")
+        group_layout.addWidget(self.adaptive_check)
+
+        group_layout.addWidget(QLabel("p值精度 (±): "))
+        self.precision_input = QDoubleSpinBox()
+        self.precision_input.setRange(0.001, 0.05)
+        self.precision_input.setDecimals(3)
+        self.precision_input.setSingleStep(0.005)
+        self.precision_input.setValue(DEFAULT_SETTINGS['adaptive_precision'])
+        self.precision_input.setEnabled(False)
+        self.adaptive_check.toggled.connect(self.precision_input.setEnabled)
+        group_layout.addWidget(self.precision_input)
+
         group_layout.addStretch()
         group.setLayout(group_layout)
         self.main_layout.addWidget(group)
@@ -297,7 +316,9 @@ class TabParams(QWidget):
             'test_type': test_type,
             'alpha': self.alpha_input.value(),
             'method': 'param' if self.radio_param.isChecked() else 'nonparam',
-            'iterations': self.iterations_input.value()
+            'iterations': self.iterations_input.value(),
+            'adaptive': self.adaptive_check.isChecked(),
+            'mc_precision': self.precision_input.value()
         }
 
         groups = self._get_current_groups()
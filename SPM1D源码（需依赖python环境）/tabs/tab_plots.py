@@ -12,6 +12,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 from modules.visualization import plot_mean_sd, plot_spm_result, plot_posthoc_result, plot_k2_result
+from modules.result_cache import analysis_key, posthoc_key
+from modules.spm_analysis import LazyPosthocResults
 from utils.config import COLORS
 
 class TabPlots(QWidget):
@@ -129,7 +131,7 @@ class TabPlots(QWidget):
         if indicator and indicator in data:
             test_data = data[indicator]
         else:
-            test_data = list(data.values())[0]
+            test_data = data[next(iter(data))]
 
         self.figure.clear()
 
@@ -159,32 +161,7 @@ class TabPlots(QWidget):
 
             elif chart_type == "SPM统计曲线图":
                 ax = self.figure.add_subplot(111)
-                spm_result = None
-                inference_result = None
-
-                if self.main_window.cached_spm_result is not None and self.main_window.cached_inference_result is not None:
-                    spm_result = self.main_window.cached_spm_result
-                    inference_result = self.main_window.cached_inference_result
-                else:
-                    from modules.spm_analysis import SPMAnalyzer
-                    np.random.seed(42)
-                    
-                    test_type = summary.get('test_type', '')
-                    analyzer = SPMAnalyzer(test_data, test_type=test_type,
-                                          method=summary['method'])
-                    spm_result, _ = analyzer.run_analysis()
-                    if spm_result:
-                        if summary['method'] == 'param':
-                            if test_type == 'anova1':
-                                inference_result, _ = analyzer.inference(alpha=summary['alpha'])
-                            else:
-                                inference_result, _ = analyzer.inference(alpha=summary['alpha'], two_tailed=True)
-                        else:
-                            inference_result, _ = analyzer.inference(alpha=summary['alpha'],
-                                                               iterations=summary.get('iterations', 500))
-                        if inference_result:
-                            self.main_window.cached_spm_result = spm_result
-                            self.main_window.cached_inference_result = inference_result
+                spm_result, inference_result = self._get_spm_results(test_data)
 
                 if spm_result and inference_result:
                     test_type = summary.get('test_type', '')
@@ -193,6 +170,8 @@ class TabPlots(QWidget):
                     else:
                         two_tailed = True
                     plot_spm_result(spm_result, inference_result, ax=ax, test_type=test_type, two_tailed=two_tailed)
+                else:
+                    ax.text(0.5, 0.5, "请先在分析结果页运行分析", ha='center', va='center', fontsize=14)
 
             elif chart_type == "事后检验图":
                 selected_group = self.group_combo.currentText()
@@ -203,29 +182,7 @@ class TabPlots(QWidget):
                     return
 
                 ax = self.figure.add_subplot(111)
-                spm_result = None
-                inference_result = None
-
-                # 使用缓存
-                cached = self.main_window.cached_posthoc_results
-                if cached is not None and selected_group in cached:
-                    pair_result = cached[selected_group]
-                    spm_result = pair_result['spm_result']
-                    inference_result = pair_result['inference_result']
-                else:
-                    np.random.seed(42)
-                    from modules.spm_analysis import SPMAnalyzer
-                    analyzer = SPMAnalyzer(test_data, test_type='anova1',
-                                          method=summary['method'])
-                    spm_result, _ = analyzer.run_analysis()
-                    if spm_result:
-                        posthoc_results, _ = analyzer.run_posthoc(alpha=summary.get('alpha', 0.05))
-                        if posthoc_results:
-                            self.main_window.cached_posthoc_results = posthoc_results
-                            if selected_group in posthoc_results:
-                                pair_result = posthoc_results[selected_group]
-                                spm_result = pair_result['spm_result']
-                                inference_result = pair_result['inference_result']
+                spm_result, inference_result = self._get_posthoc_pair(test_data, selected_group)
 
                 if spm_result and inference_result:
                     plot_posthoc_result(spm_result, inference_result, ax=ax, title=selected_group)
@@ -311,6 +268,49 @@ class TabPlots(QWidget):
         except Exception as e:
             print(f"绑图错误: {e}")
 
+    def _get_spm_results(self, test_data):
+        """取已运行分析的统计场与推断结果：先用当前结果，再查结果缓存，绘图时不重新计算"""
+        spm_result = self.main_window.cached_spm_result
+        inference_result = self.main_window.cached_inference_result
+        if spm_result is not None and inference_result is not None:
+            return spm_result, inference_result
+        try:
+            cached = self.main_window.result_cache.get(analysis_key(
+                test_data, self.main_window.analysis_params, self.main_window.analysis_method))
+        except Exception:
+            cached = None
+        if cached is None:
+            return None, None
+        _, spm_result, inference_result = cached
+        self.main_window.cached_spm_result = spm_result
+        self.main_window.cached_inference_result = inference_result
+        return spm_result, inference_result
+
+    def _get_posthoc_pair(self, test_data, pair_name):
+        """取已运行事后检验中某组对的结果；按需计算的结果在首次查看该组对时才计算"""
+        posthoc_results = self.main_window.cached_posthoc_results
+        if posthoc_results is None:
+            summary = self.main_window.analysis_result or {}
+            try:
+                cached = self.main_window.result_cache.get(posthoc_key(
+                    test_data, self.main_window.analysis_method, summary.get('alpha', 0.05),
+                    correction=self.main_window.posthoc_correction))
+            except Exception:
+                cached = None
+            if cached is None:
+                return None, None
+            posthoc_results = cached[0]
+            self.main_window.cached_posthoc_results = posthoc_results
+        try:
+            pair_result = posthoc_results.get(pair_name)
+        except Exception:
+            return None, None
+        if pair_result is None:
+            return None, None
+        if isinstance(posthoc_results, LazyPosthocResults):
+            self.main_window.tab_results.refresh_posthoc_summary()
+        return pair_result['spm_result'], pair_result['inference_result']
+
     def update_group_combo(self, text=None):
         chart_type = self.chart_type_combo.currentText()
         self.group_combo.clear()
@@ -385,7 +385,7 @@ class TabPlots(QWidget):
             if indicator and indicator in data:
                 test_data = data[indicator]
             else:
-                test_data = list(data.values())[0]
+                test_data = data[next(iter(data))]
 
             try:
                 from modules.visualization import export_figure
@@ -413,31 +413,7 @@ class TabPlots(QWidget):
                     export_figure(fig, filename.replace(f'.{fmt}', ''), fmt)
 
                 elif chart_type == "SPM统计曲线图":
-                    spm_result = None
-                    inference_result = None
-
-                    # 使用缓存
-                    if self.main_window.cached_spm_result is not None and self.main_window.cached_inference_result is not None:
-                        spm_result = self.main_window.cached_spm_result
-                        inference_result = self.main_window.cached_inference_result
-                    else:
-                        np.random.seed(42)
-                        from modules.spm_analysis import SPMAnalyzer
-                        analyzer = SPMAnalyzer(test_data, test_type=summary['test_type'],
-                                              method=summary['method'])
-                        spm_result, _ = analyzer.run_analysis()
-                        if spm_result:
-                            if summary['method'] == 'param':
-                                if summary.get('test_type') == 'anova1':
-                                    inference_result, _ = analyzer.inference(alpha=summary['alpha'])
-                                else:
-                                    inference_result, _ = analyzer.inference(alpha=summary['alpha'], two_tailed=True)
-                            else:
-                                inference_result, _ = analyzer.inference(alpha=summary['alpha'],
-                                                               iterations=summary.get('iterations', 500))
-                            if inference_result:
-                                self.main_window.cached_spm_result = spm_result
-                                self.main_window.cached_inference_result = inference_result
+                    spm_result, inference_result = self._get_spm_results(test_data)
 
                     if spm_result and inference_result:
                         # 根据检验类型确定阈值线显示
@@ -452,29 +428,7 @@ class TabPlots(QWidget):
 
                 elif chart_type == "事后检验图":
                     if selected_group:
-                        spm_result = None
-                        inference_result = None
-
-                        # 使用缓存
-                        cached = self.main_window.cached_posthoc_results
-                        if cached is not None and selected_group in cached:
-                            pair_result = cached[selected_group]
-                            spm_result = pair_result['spm_result']
-                            inference_result = pair_result['inference_result']
-                        else:
-                            np.random.seed(42)
-                            from modules.spm_analysis import SPMAnalyzer
-                            analyzer = SPMAnalyzer(test_data, test_type='anova1',
-                                                  method=summary['method'])
-                            spm_result, _ = analyzer.run_analysis()
-                            if spm_result:
-                                posthoc_results, _ = analyzer.run_posthoc(alpha=summary.get('alpha', 0.05))
-                                if posthoc_results:
-                                    self.main_window.cached_posthoc_results = posthoc_results
-                                    if selected_group in posthoc_results:
-                                        pair_result = posthoc_results[selected_group]
-                                        spm_result = pair_result['spm_result']
-                                        inference_result = pair_result['inference_result']
+                        spm_result, inference_result = self._get_posthoc_pair(test_data, selected_group)
 
                         if spm_result and inference_result:
                             fig, ax = plt.subplots(figsize=(10, 6))
@@ -1,12 +1,20 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                               QPushButton, QGroupBox, QTableWidget,
                               QTableWidgetItem, QMessageBox, QTextEdit,
-                              QHeaderView, QProgressDialog, QFileDialog)
+                              QHeaderView, QProgressDialog, QFileDialog, QComboBox,
+                              QCheckBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtGui import QFont
-from modules.spm_analysis import SPMAnalyzer
+from modules.result_cache import run_analysis_cached, run_posthoc_cached, alpha_sweep_cached
+from modules.spm_analysis import posthoc_pair_summary, summarize_posthoc, LazyPosthocResults
+from utils.config import DEFAULT_SETTINGS
 import numpy as np
 
+POSTHOC_CORRECTIONS = [
+    ("Bonferroni校正", 'bonferroni'),
+    ("置换最大统计量 (maxT)", 'maxt'),
+]
+
 class AnalysisThread(QThread):
     finished = pyqtSignal(dict, object, object)
     error = pyqtSignal(str)
@@ -20,57 +28,17 @@ class AnalysisThread(QThread):
 
     def run(self):
         try:
-            np.random.seed(42)
-
-            test_type = self.params.get('test_type')
             indicator = getattr(self.main_window, 'selected_indicator', None)
 
             if indicator and indicator in self.data:
                 test_data = self.data[indicator]
             else:
-                test_data = list(self.data.values())[0]
-
-            kwargs = {}
-            if self.method == 'nonparam':
-                kwargs['iterations'] = self.params.get('iterations', 500)
-            if test_type == 'ttest':
-                kwargs['y_data'] = self.params.get('y_data')
-                kwargs['mu_data'] = self.params.get('mu_data', 0)
-            if test_type == 'regress':
-                kwargs['y_data'] = self.params.get('y_data')
-                kwargs['x_data'] = self.params.get('x_data')
-
-            if test_type == 'regress':
-                method = 'param'
-            else:
-                method = self.method
+                test_data = self.data[next(iter(self.data))]
 
-            analyzer = SPMAnalyzer(test_data, test_type=test_type,
-                                 method=method, **kwargs)
+            summary, spm_result, inference_result = run_analysis_cached(
+                getattr(self.main_window, 'result_cache', None),
+                test_data, self.params, self.method)
 
-            spm_result, error = analyzer.run_analysis()
-            if error:
-                raise Exception(error)
-
-            if self.method == 'param':
-                if test_type == 'anova1':
-                    inference_result, inf_error = analyzer.inference(alpha=self.params['alpha'])
-                else:
-                    inference_result, inf_error = analyzer.inference(alpha=self.params['alpha'],
-                                                              two_tailed=True)
-            else:
-                inference_result, inf_error = analyzer.inference(alpha=self.params['alpha'],
-                                                              iterations=self.params.get('iterations', 500))
-            if inf_error:
-                raise Exception(inf_error)
-
-            summary = analyzer.get_results_summary()
-            
-            if test_type == 'regress':
-                summary['y_data'] = self.params.get('y_data')
-                summary['y_name'] = self.params.get('y_name')
-                summary['x_name'] = self.params.get('x_name')
-            
             self.finished.emit(summary, spm_result, inference_result)
 
         except Exception as e:
@@ -78,37 +46,59 @@ class AnalysisThread(QThread):
 
 
 class PosthocThread(QThread):
-    finished = pyqtSignal(dict, dict, object)
+    pair_finished = pyqtSignal(str, dict)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(dict, object, object)
     error = pyqtSignal(str)
 
-    def __init__(self, main_window, data, alpha=0.05):
+    def __init__(self, main_window, data, alpha=0.05, correction='bonferroni',
+                 lazy=False, background=True):
         super().__init__()
         self.main_window = main_window
         self.data = data
         self.alpha = alpha
+        self.correction = correction
+        self.lazy = lazy
+        self.background = background
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
 
     def run(self):
         try:
-            np.random.seed(42)
-
             indicator = getattr(self.main_window, 'selected_indicator', None)
             if indicator and indicator in self.data:
                 test_data = self.data[indicator]
             else:
-                test_data = list(self.data.values())[0]
-
-            analyzer = SPMAnalyzer(test_data, test_type='anova1',
-                                 method=self.main_window.analysis_method)
+                test_data = self.data[next(iter(self.data))]
+
+            n_groups = len(test_data)
+            total = n_groups * (n_groups - 1) // 2
+            done = []
+
+            def on_pair(pair_name, results):
+                done.append(pair_name)
+                self.pair_finished.emit(pair_name, posthoc_pair_summary(results))
+                self.progress.emit(len(done), total)
+
+            self.progress.emit(0, total)
+            summary, posthoc_results, spm_result = run_posthoc_cached(
+                getattr(self.main_window, 'result_cache', None),
+                test_data, self.main_window.analysis_method, alpha=self.alpha,
+                correction=self.correction, on_pair=None if self.lazy else on_pair,
+                lazy=self.lazy, params=self.main_window.analysis_params)
+
+            if self.lazy:
+                # 先算出第一个组对供查看，其余组对在查看时或后台计算
+                first = next(iter(posthoc_results))
+                on_pair(first, posthoc_results[first])
+                summary = summarize_posthoc(posthoc_results)
+                self.finished.emit(summary, posthoc_results, spm_result)
+                if self.background:
+                    posthoc_results.compute_remaining(on_pair, cancelled=lambda: self._cancelled)
+                return
 
-            spm_result, error = analyzer.run_analysis()
-            if error:
-                raise Exception(error)
-
-            posthoc_results, ph_error = analyzer.run_posthoc(alpha=self.alpha)
-            if ph_error:
-                raise Exception(ph_error)
-
-            summary = analyzer.get_posthoc_summary()
             self.finished.emit(summary, posthoc_results, spm_result)
 
         except Exception as e:
@@ -121,6 +111,8 @@ class TabResults(QWidget):
         self.summary = None
         self.analysis_thread = None
         self.posthoc_summary = None
+        self.partial_posthoc = {}
+        self.posthoc_thread = None
         self.setup_ui()
 
     def setup_ui(self):
@@ -149,7 +141,12 @@ class TabResults(QWidget):
         self.btn_run = QPushButton("运行SPM分析")
         self.btn_run.clicked.connect(self.run_analysis)
 
+        self.btn_alpha_sweep = QPushButton("多α对比")
+        self.btn_alpha_sweep.setToolTip("沿用已计算的统计场（及置换分布），在多个显著性水平下重新推断")
+        self.btn_alpha_sweep.clicked.connect(self.show_alpha_sweep)
+
         group_layout.addWidget(self.btn_run)
+        group_layout.addWidget(self.btn_alpha_sweep)
         group_layout.addStretch()
 
         group.setLayout(group_layout)
@@ -188,8 +185,27 @@ class TabResults(QWidget):
         btn_posthoc = QPushButton("执行事后检验")
         btn_posthoc.clicked.connect(self.run_posthoc)
 
+        self.correction_combo = QComboBox()
+        for label, correction in POSTHOC_CORRECTIONS:
+            self.correction_combo.addItem(label, correction)
+        self.correction_combo.setCurrentIndex(
+            [c for _, c in POSTHOC_CORRECTIONS].index(DEFAULT_SETTINGS['posthoc_correction']))
+        self.correction_combo.setToolTip("maxT：全部组对共用一套置换，以各组对最大统计量控制整体I类错误，仅用于非参数检验")
+
+        self.lazy_check = QCheckBox("按需计算")
+        self.lazy_check.setChecked(DEFAULT_SETTINGS['posthoc_lazy'])
+        self.lazy_check.setToolTip("只先计算第一个组对，其余组对在图表中选择时才计算，适合组数较多的ANOVA")
+        self.background_check = QCheckBox("后台计算其余组对")
+        self.background_check.setChecked(DEFAULT_SETTINGS['posthoc_background'])
+        self.background_check.setEnabled(self.lazy_check.isChecked())
+        self.lazy_check.toggled.connect(self.background_check.setEnabled)
+
         btn_layout = QHBoxLayout()
         btn_layout.addWidget(btn_posthoc)
+        btn_layout.addWidget(QLabel("多重比较校正:"))
+        btn_layout.addWidget(self.correction_combo)
+        btn_layout.addWidget(self.lazy_check)
+        btn_layout.addWidget(self.background_check)
         btn_layout.addStretch()
 
         group_layout.addWidget(self.posthoc_text)
@@ -235,6 +251,7 @@ class TabResults(QWidget):
         return layout
 
     def run_analysis(self):
+        self.cancel_posthoc()
         self.main_window.cached_spm_result = None
         self.main_window.cached_inference_result = None
         self.main_window.cached_posthoc_results = None
@@ -287,6 +304,18 @@ class TabResults(QWidget):
             ("H0拒绝", "是" if self.summary.get('h0reject') else "否"),
             ("聚类数", str(self.summary.get('n_clusters', 0))),
         ]
+        if self.summary.get('n_permutations'):
+            n_perm = self.summary['n_permutations']
+            data.append(("置换次数", f"{n_perm}（精确枚举）" if self.summary.get('exact_permutations') else str(n_perm)))
+        mc = self.summary.get('monte_carlo')
+        if mc:
+            lo, hi = mc['zstar_ci']
+            data.append(("阈值99%区间", f"{lo:.4f} ~ {hi:.4f}"))
+            p_hw = max(mc['alpha_halfwidth'], mc['p_halfwidth'] or 0)
+            state = "已稳定" if mc['settled'] else "未达到"
+            if mc['stopped_early']:
+                state += "，提前停止"
+            data.append(("p值精度", f"±{p_hw:.4f}（目标 ±{mc['precision']:.3f}，{state}）"))
 
         self.summary_table.setRowCount(len(data))
         for i, (param, value) in enumerate(data):
@@ -345,6 +374,36 @@ class TabResults(QWidget):
             self.summary_table.setItem(current_rows, 0, QTableWidgetItem("  beta系数"))
             self.summary_table.setItem(current_rows, 1, QTableWidgetItem(f"shape: {beta.shape}"))
 
+    def show_alpha_sweep(self):
+        if not self.summary:
+            QMessageBox.warning(self, "警告", "请先运行分析")
+            return
+
+        data = self.main_window.analysis_data
+        indicator = getattr(self.main_window, 'selected_indicator', None)
+        if indicator and indicator in data:
+            test_data = data[indicator]
+        else:
+            test_data = data[next(iter(data))]
+
+        try:
+            rows = alpha_sweep_cached(self.main_window.result_cache, test_data,
+                                      self.main_window.analysis_params,
+                                      self.main_window.analysis_method,
+                                      DEFAULT_SETTINGS['alpha_sweep_levels'])
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"多α对比失败: {e}")
+            return
+
+        lines = []
+        for row in rows:
+            if 'error' in row:
+                lines.append(f"α = {row['alpha']}: {row['error']}")
+            else:
+                lines.append(f"α = {row['alpha']}: 临界阈值 {row['zstar']:.4f}, "
+                             f"H0拒绝 {'是' if row['h0reject'] else '否'}, 聚类数 {row['n_clusters']}")
+        QMessageBox.information(self, "多α对比", "\n".join(lines))
+
     def export_all_data(self):
         if not self.summary:
             QMessageBox.warning(self, "警告", "请先运行分析")
@@ -389,19 +448,73 @@ class TabResults(QWidget):
             QMessageBox.information(self, "信息", "主效应不显著，无需进行事后检验")
             return
 
+        self.cancel_posthoc(wait=True)
+
         self.progress = QProgressDialog("正在运行事后检验...", "取消", 0, 0, self)
         self.progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.progress.setAutoClose(False)
         self.progress.show()
 
+        self.posthoc_summary = None
+        self.partial_posthoc = {}
+        self.posthoc_text.clear()
+
+        correction = self.correction_combo.currentData()
+        if correction == 'maxt' and self.main_window.analysis_method == 'param':
+            QMessageBox.information(self, "信息", "置换最大统计量校正仅适用于非参数检验，将使用Bonferroni校正")
+            correction = 'bonferroni'
+
+        self.main_window.posthoc_correction = correction
+        self.main_window.posthoc_lazy = self.lazy_check.isChecked()
         self.posthoc_thread = PosthocThread(
             self.main_window,
             self.main_window.analysis_data,
-            alpha=self.summary.get('alpha', 0.05)
+            alpha=self.summary.get('alpha', 0.05),
+            correction=correction,
+            lazy=self.main_window.posthoc_lazy,
+            background=self.background_check.isChecked()
         )
+        self.posthoc_thread.pair_finished.connect(self.on_posthoc_pair_finished)
+        self.posthoc_thread.progress.connect(self.on_posthoc_progress)
         self.posthoc_thread.finished.connect(self.on_posthoc_finished)
         self.posthoc_thread.error.connect(self.on_posthoc_error)
         self.posthoc_thread.start()
 
+    def cancel_posthoc(self, wait=False):
+        """停止按需计算仍在后台进行的部分，之后到达的组对结果不再显示"""
+        if self.posthoc_thread is None or not self.posthoc_thread.isRunning():
+            return
+        self.posthoc_thread.cancel()
+        try:
+            self.posthoc_thread.pair_finished.disconnect()
+        except TypeError:
+            # 已在前一次取消时断开
+            pass
+        if wait:
+            self.posthoc_thread.wait()
+
+    def on_posthoc_pair_finished(self, pair_name, result):
+        self.partial_posthoc[pair_name] = result
+        if not self.refresh_posthoc_summary():
+            self.update_posthoc_text(self.partial_posthoc)
+
+    def refresh_posthoc_summary(self):
+        """按需计算时把后台或图表中新算出的组对并入汇总，返回是否为按需计算的结果"""
+        cached = self.main_window.cached_posthoc_results
+        if self.posthoc_summary is None or not isinstance(cached, LazyPosthocResults):
+            return False
+        self.posthoc_summary = summarize_posthoc(cached)
+        self.main_window.posthoc_summary = self.posthoc_summary
+        self.update_posthoc_text()
+        return True
+
+    def on_posthoc_progress(self, done, total):
+        if not self.progress.isVisible():
+            return
+        self.progress.setMaximum(total)
+        self.progress.setValue(done)
+        self.progress.setLabelText(f"正在运行事后检验... ({done}/{total} 对)")
+
     def on_posthoc_finished(self, summary, posthoc_results=None, spm_result=None):
         self.progress.close()
         self.posthoc_summary = summary
@@ -427,20 +540,27 @@ class TabResults(QWidget):
         self.main_window.tab_plots.chart_type_combo.setCurrentText("事后检验图")
         self.main_window.tab_plots.update_chart()
 
+        if isinstance(posthoc_results, LazyPosthocResults):
+            return
         QMessageBox.information(self, "完成", "事后检验完成！")
 
     def on_posthoc_error(self, error):
         self.progress.close()
         QMessageBox.critical(self, "错误", f"事后检验失败: {error}")
 
-    def update_posthoc_text(self):
-        if not self.posthoc_summary:
+    def update_posthoc_text(self, summary=None):
+        summary = self.posthoc_summary if summary is None else summary
+        if not summary:
             return
 
-        text = "事后检验结果 (Bonferroni校正)\n"
+        correction = next(iter(summary.values())).get('correction', 'bonferroni')
+        if correction == 'maxt':
+            text = "事后检验结果 (置换最大统计量校正，各组对共用临界阈值)\n"
+        else:
+            text = "事后检验结果 (Bonferroni校正)\n"
         text += "=" * 50 + "\n\n"
 
-        for pair_name, result in self.posthoc_summary.items():
+        for pair_name, result in summary.items():
             alpha_corr = result.get('alpha_corrected', 0)
             zstar = result.get('zstar')
             significant = result.get('significant')
@@ -448,7 +568,7 @@ class TabResults(QWidget):
             n_clusters = result.get('n_clusters', 0)
 
             text += f"比较对: {pair_name}\n"
-            text += f"校正α = {alpha_corr:.6f}\n"
+            text += f"{'整体α' if correction == 'maxt' else '校正α'} = {alpha_corr:.6f}\n"
             if zstar is not None:
                 text += f"阈值 z* = ±{zstar:.4f}\n"
 
@@ -462,4 +582,8 @@ class TabResults(QWidget):
                 text += "结果: 不显著\n"
             text += "\n"
 
+        cached = self.main_window.cached_posthoc_results
+        if isinstance(cached, LazyPosthocResults) and len(summary) < len(cached):
+            text += f"已计算 {len(summary)}/{len(cached)} 个组对，其余组对在图表中选择或后台计算后显示\n"
+
         self.posthoc_text.setText(text)
@@ -11,8 +11,27 @@ COLORS = {
 
 DEFAULT_SETTINGS = {
     'normality_alpha': 0.05,
+    'normality_block_groups': 4,
     'significance_alpha': 0.05,
     'permutation_iterations': 500,
     'interp': True,
     'two_tailed': True,
+    'load_workers': None,
+    'cache_enabled': True,
+    'cache_max_mb': 1024,
+    'max_loaded_indicators': 2,
+    'resample_nodes': None,
+    'storage_dtype': 'float64',
+    'result_cache_size': 16,
+    'result_cache_max_mb': 512,
+    'alpha_sweep_levels': [0.1, 0.05, 0.01, 0.005, 0.001],
+    'permutation_memory_mb': 64,
+    'permutation_workers': None,
+    'random_seed': 42,
+    'adaptive_batch': 200,
+    'adaptive_precision': 0.01,
+    'posthoc_correction': 'bonferroni',
+    'posthoc_iterations': 1000,
+    'posthoc_lazy': False,
+    'posthoc_background': True,
 }